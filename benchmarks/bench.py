@@ -0,0 +1,279 @@
+#!/usr/bin/python2
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import logging as log
+from time import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import checksum  # noqa: E402
+import http_cache  # noqa: E402
+import http_client  # noqa: E402
+import git_release  # noqa: E402
+import watch_builds  # noqa: E402
+import git_create_pr  # noqa: E402
+from lazy_import import lazy_module  # noqa: E402
+from stubs import GitHubStub, DockerHubStub  # noqa: E402
+
+github = lazy_module('github')
+
+SCENARIOS = ['watch_build', 'watch_pr_statuses', 'create_release', 'create_checksum_text']
+# Parameters each scenario is run with, every combination being measured
+SCALES = {
+    'small': {'repos': [1, 4], 'history': [50], 'contexts': [2], 'assets': [4]},
+    'large': {'repos': [1, 4, 16], 'history': [50, 500], 'contexts': [2, 8],
+              'assets': [4, 32]}
+}
+RUNS = 3
+ASSET_SIZE = 1 << 20
+# Poll interval of the watch scenarios, in seconds, and the polls before builds or contexts pass
+POLL_INTERVAL = 0.05
+FINISH_AFTER = 3
+DEADLINE = 120
+# Regressions allowed against a baseline, as a share of its values
+WALL_TOLERANCE = 0.5
+COUNT_TOLERANCE = 0.1
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Measure the wall time, requests and bytes '
+                                                 'transferred of the release scripts against '
+                                                 'local github and dockerhub stand-ins.')
+
+    parser.add_argument('-k', dest='scenarios', type=str, nargs='+', default=SCENARIOS,
+                        choices=SCENARIOS, help='the scenarios to run (Default all).')
+
+    parser.add_argument('-s', dest='scale', type=str, default='small', choices=sorted(SCALES),
+                        help='the sizes each scenario is run at (Default small).')
+
+    parser.add_argument('-n', dest='runs', type=int, default=RUNS,
+                        help='runs per measurement, the median wall time is reported '
+                             '(Default {}).'.format(RUNS))
+
+    parser.add_argument('-l', dest='latency', type=float, default=0,
+                        help='milliseconds the stand-ins wait before each response (Default 0).')
+
+    parser.add_argument('-p', dest='padding', type=int, default=0,
+                        help='bytes added to each build or status returned, to scale payloads '
+                             '(Default 0).')
+
+    parser.add_argument('-f', dest='failure_rate', type=float, default=0,
+                        help='share of polls of builds and statuses answered with a 502 '
+                             '(Default 0).')
+
+    parser.add_argument('-o', dest='output', type=str, default=None,
+                        help='write the results to this json file, e.g. to use as a baseline.')
+
+    parser.add_argument('-b', dest='baseline', type=str, default=None,
+                        help='a json file of earlier results, exits non-zero if a measurement '
+                             'regressed by more than {:.0%} in wall time or {:.0%} in requests or '
+                             'bytes.'.format(WALL_TOLERANCE, COUNT_TOLERANCE))
+
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show the logs of the scripts benchmarked.')
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s',
+                    level=log.INFO if args.verbose else log.WARNING)
+
+    stub_opts = {'latency': args.latency / 1000.0, 'padding': args.padding,
+                 'failure_rate': args.failure_rate}
+    return args.scenarios, SCALES[args.scale], args.runs, stub_opts, args.output, args.baseline
+
+
+class Bench(object):
+    """The stand-ins and scratch space shared by the scenarios."""
+
+    def __init__(self, stub_opts):
+        self.github = GitHubStub(**stub_opts).start()
+        self.docker = DockerHubStub(**stub_opts).start()
+        self.tmpdir = tempfile.mkdtemp(prefix='oshinko-bench-')
+        self.count = 0
+        self.asset_sets = {}
+
+        # As get_github does, so PyGithub's requests are paced like those of the scripts
+        http_client.route_github()
+        watch_builds.V2_ENDPOINT = '{}/v2'.format(self.docker.url)
+        watch_builds.REGISTRY_ENDPOINT = self.docker.url
+        git_create_pr.PR_CONTEXT_LOAD_LENGTH = 0
+
+    def unique(self):
+        self.count += 1
+        return self.count
+
+    def repo(self):
+        return github.Github('bench', 'token', base_url=self.github.url).get_repo('bench/repo')
+
+    def assets(self, count):
+        if count not in self.asset_sets:
+            assets = []
+            for i in range(count):
+                name = os.path.join(self.tmpdir, 'asset-{}-{}.tar.gz'.format(count, i))
+                with open(name, 'wb') as f:
+                    f.write(os.urandom(ASSET_SIZE))
+                assets.append({'name': name, 'label': os.path.basename(name),
+                               'Content-Type': 'application/gzip'})
+            self.asset_sets[count] = assets
+        return self.asset_sets[count]
+
+    def digest_cache(self):
+        return checksum.configure(os.path.join(self.tmpdir, 'sha256-{}.json'.format(self.unique())))
+
+    def close(self):
+        self.github.stop()
+        self.docker.stop()
+        shutil.rmtree(self.tmpdir)
+
+
+# Each scenario prepares a run from its parameters and returns the function measured
+
+def watch_build(bench, repos, history):
+    tags = watch_builds.get_docker_tags(['v1'], ['master'])
+    watches = []
+    for i in range(repos):
+        repo = 'bench/repo-{}'.format(bench.unique())
+        bench.docker.add_repo(repo, [t['docker_tag'] for t in tags], history, FINISH_AFTER)
+        watches.append(watch_builds.RepoWatch(repo, 'token', False, tags))
+
+    def run():
+        results = watch_builds.watch_builds(watches, POLL_INTERVAL, DEADLINE)
+        if not all(results.values()):
+            raise RuntimeError('Builds were not watched to completion.')
+    return run
+
+
+def watch_pr_statuses(bench, contexts):
+    number = bench.unique()
+    names = ['ci/context-{}'.format(i) for i in range(contexts)]
+    bench.github.add_pull(number, 'sha{}'.format(number), names, FINISH_AFTER)
+    pull = bench.repo().get_pull(number)
+    since = datetime.utcnow() - timedelta(minutes=1)
+
+    def run():
+        git_create_pr.watch_pr_statuses(pull, names, POLL_INTERVAL, DEADLINE, since, 'token')
+    return run
+
+
+def create_release(bench, assets):
+    repo, assets, tag = bench.repo(), bench.assets(assets), 'v{}'.format(bench.unique())
+    bench.digest_cache()
+
+    def run():
+        git_release.create_release(repo, tag, tag, 'Benchmark release', False, False, 'master',
+                                   assets, auth=('bench', 'token'))
+    return run
+
+
+def create_checksum_text(bench, assets, cache):
+    assets = bench.assets(assets)
+    bench.digest_cache()
+    if cache == 'warm':
+        git_release.create_checksum_text(assets)
+
+    def run():
+        git_release.create_checksum_text(assets)
+    return run
+
+
+def variants(scenario, scale):
+    """The parameters the scenario is measured with at the scale."""
+    if scenario == 'watch_build':
+        return [{'repos': r, 'history': h} for r in scale['repos'] for h in scale['history']]
+    if scenario == 'watch_pr_statuses':
+        return [{'contexts': c} for c in scale['contexts']]
+    if scenario == 'create_release':
+        return [{'assets': a} for a in scale['assets']]
+    return [{'assets': a, 'cache': c} for a in scale['assets'] for c in ('cold', 'warm')]
+
+
+def measure(bench, scenario, params, runs):
+    walls, counters = [], None
+    for _ in range(runs):
+        # Every run starts without connections, cached responses or rate-limit budgets
+        http_client.configure(limiter=http_client.RateLimiter())
+        http_cache.configure()
+        run = globals()[scenario](bench, **params)
+
+        bench.github.reset()
+        bench.docker.reset()
+        start = time()
+        run()
+        walls.append(time() - start)
+
+        counters = dict((k, bench.github.counters()[k] + bench.docker.counters()[k])
+                        for k in bench.github.counters())
+    walls.sort()
+    result = {'scenario': scenario,
+              'params': ' '.join('{}={}'.format(k, params[k]) for k in sorted(params)),
+              'wall': walls[len(walls) // 2]}
+    result.update(counters)
+    return result
+
+
+def key(result):
+    return '{} {}'.format(result['scenario'], result['params'])
+
+
+def regressions(results, baseline):
+    previous = dict((key(r), r) for r in baseline)
+    found = []
+    for result in results:
+        base = previous.get(key(result))
+        if base is None:
+            continue
+        if result['wall'] > base['wall'] * (1 + WALL_TOLERANCE):
+            found.append('{}: wall time {:.3f}s, was {:.3f}s'
+                         .format(key(result), result['wall'], base['wall']))
+        for counter in ('requests', 'bytes'):
+            if result[counter] > base[counter] * (1 + COUNT_TOLERANCE):
+                found.append('{}: {} {}, was {}'
+                             .format(key(result), counter, result[counter], base[counter]))
+    return found
+
+
+def report(results):
+    lines = ['{:<22} {:<22} {:>9} {:>9} {:>6} {:>11}'
+             .format('SCENARIO', 'PARAMS', 'WALL(s)', 'REQUESTS', '304s', 'BYTES')]
+    for r in results:
+        lines.append('{:<22} {:<22} {:>9.3f} {:>9} {:>6} {:>11}'
+                     .format(r['scenario'], r['params'], r['wall'], r['requests'],
+                             r['not_modified'], r['bytes']))
+    return '\n'.join(lines)
+
+
+def main():
+    scenarios, scale, runs, stub_opts, output, baseline = get_opts()
+
+    bench = Bench(stub_opts)
+    results = []
+    try:
+        for scenario in scenarios:
+            for params in variants(scenario, scale):
+                results.append(measure(bench, scenario, params, runs))
+    finally:
+        bench.close()
+
+    print(report(results))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if baseline:
+        with open(baseline, 'r') as f:
+            found = regressions(results, json.load(f))
+        for regression in found:
+            log.error('Regression in {}'.format(regression))
+        if found:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python2
+import os
+import sys
+import json
+import argparse
+import subprocess
+import logging as log
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points run dozens of times per release
+SCRIPTS = ['git_release.py', 'create_release_file.py', 'git_create_pr.py', 'watch_builds.py',
+           'checksum.py', 'release_pipeline.py', 'retag.py',
+           'verify_images.py', 'version_templates.py', 'git_mirror.py']
+# Modules that must only be imported once they are used
+HEAVY_MODULES = ['github', 'cerberus', 'ruamel', 'magic', 'requests']
+RUNS = 5
+# Startup time allowed on top of a bare interpreter, in milliseconds
+BUDGET = 150
+
+# Runs a script with --help in a fresh interpreter and reports what it imported
+PROBE = '''
+import sys, json, runpy
+sys.path.insert(0, {root!r})
+sys.argv = [{script!r}, '--help']
+stdout, sys.stdout = sys.stdout, open({devnull!r}, 'w')
+try:
+    runpy.run_path({script!r}, run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = stdout
+print(json.dumps(sorted(set(m.split('.')[0] for m in sys.modules))))
+'''
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Time the --help startup of the release scripts '
+                                                 'and fail if any of them got slower than a bare '
+                                                 'interpreter plus a budget, or imports a heavy '
+                                                 'module before it is needed.')
+
+    parser.add_argument('-b', dest='budget', type=float, default=BUDGET,
+                        help='milliseconds allowed on top of a bare interpreter (Default {}).'
+                        .format(BUDGET))
+
+    parser.add_argument('-n', dest='runs', type=int, default=RUNS,
+                        help='runs per script, the median is reported (Default {}).'.format(RUNS))
+
+    parser.add_argument('-p', dest='python', type=str, default=sys.executable,
+                        help='the interpreter to benchmark (Default {}).'.format(sys.executable))
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+
+    return args.budget, args.runs, args.python
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def time_command(command, runs):
+    """Median wall time of command in milliseconds, and its output of the last run."""
+    timings, output = [], None
+    for _ in range(runs):
+        start = time()
+        output = subprocess.check_output(command, cwd=ROOT)
+        timings.append((time() - start) * 1000)
+    return median(timings), output
+
+
+def main():
+    budget, runs, python = get_opts()
+
+    bare, _ = time_command([python, '-c', 'pass'], runs)
+    log.info('Bare interpreter: {:.0f} ms'.format(bare))
+
+    failed = False
+    for script in SCRIPTS:
+        probe = PROBE.format(root=ROOT, script=os.path.join(ROOT, script), devnull=os.devnull)
+        elapsed, output = time_command([python, '-c', probe], runs)
+        loaded = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        heavy = [m for m in HEAVY_MODULES if m in loaded]
+
+        log.info('{:<24} {:>6.0f} ms (+{:.0f} ms)'.format(script, elapsed, elapsed - bare))
+        if heavy:
+            log.error('{} imports {} before it is needed.'.format(script, ', '.join(heavy)))
+            failed = True
+        if elapsed - bare > budget:
+            log.error('{} starts {:.0f} ms slower than a bare interpreter, over the budget of '
+                      '{:.0f} ms.'.format(script, elapsed - bare, budget))
+            failed = True
+
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
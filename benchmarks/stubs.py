@@ -0,0 +1,431 @@
+import re
+import json
+import random
+import hashlib
+import threading
+from time import sleep
+from datetime import datetime
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Docker Hub build states
+SUCCESS, BUILDING = 10, 3
+# Most builds between the latest builds of two watched tags
+LATEST_SPACING = 25
+
+# Registry media types
+MANIFEST_TYPE = 'application/vnd.docker.distribution.manifest.v2+json'
+LIST_TYPE = 'application/vnd.docker.distribution.manifest.list.v2+json'
+CONFIG_TYPE = 'application/vnd.docker.container.image.v1+json'
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Stub(object):
+    """Local HTTP server standing in for a remote api, with counters.
+
+    Routes are (method, regex, function) tuples, the function being called
+    with the match, the parsed query and the request body and returning a
+    status, headers and a json-able or bytes body. Requests authorize()
+    answers for are rejected before reaching a route. GET responses carry an
+    ETag and are answered with a 304 when revalidated, like github's. Every
+    request waits latency seconds, and GETs of paths matching failure_paths
+    fail with a 502 at failure_rate. Requests and payload bytes in each
+    direction are counted, and the connections kept alive, as a remote
+    server would.
+    """
+
+    failure_paths = None
+
+    def __init__(self, latency=0, padding=0, failure_rate=0, seed=0):
+        self.latency = latency
+        self.padding = 'x' * padding
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.routes = []
+        self.reset()
+        self.server = _Server(('127.0.0.1', 0), self._handler())
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.failures = 0
+            self.not_modified = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def counters(self):
+        with self.lock:
+            return {'requests': self.requests, 'failures': self.failures,
+                    'not_modified': self.not_modified,
+                    'bytes': self.bytes_in + self.bytes_out}
+
+    def route(self, method, pattern, function):
+        self.routes.append((method, re.compile(pattern + '$'), function))
+
+    def authorize(self, method, path, headers):
+        """A response rejecting the request, or None to let it through."""
+        return None
+
+    def _fail(self, method, path):
+        if method != 'GET' or not self.failure_rate or not self.failure_paths:
+            return False
+        with self.lock:
+            return re.search(self.failure_paths, path) and self.random.random() < self.failure_rate
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def respond(self, status, headers, body):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                self.wfile.write(body)
+                with stub.lock:
+                    stub.bytes_out += len(body)
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = self.rfile.read(length) if length else b''
+                url = urlparse(self.path)
+                with stub.lock:
+                    stub.requests += 1
+                    stub.bytes_in += len(data)
+                if stub.latency:
+                    sleep(stub.latency)
+
+                if stub._fail(self.command, url.path):
+                    with stub.lock:
+                        stub.failures += 1
+                    return self.respond(502, {}, b'')
+
+                for method, pattern, function in stub.routes:
+                    match = pattern.match(url.path)
+                    if method == self.command and match:
+                        break
+                else:
+                    return self.respond(404, {}, b'{"message": "Not Found"}')
+
+                rejected = stub.authorize(self.command, url.path, self.headers)
+                if rejected:
+                    status, headers, body = rejected
+                else:
+                    status, headers, body = function(match, parse_qs(url.query), data)
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode('utf-8') if body is not None else b''
+                headers = dict({'Content-Type': 'application/json'}, **(headers or {}))
+                if self.command == 'GET' and status == 200:
+                    etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+                    headers['ETag'] = etag
+                    if self.headers.get('If-None-Match') == etag:
+                        with stub.lock:
+                            stub.not_modified += 1
+                        return self.respond(304, {'ETag': etag}, b'')
+                self.respond(status, headers, body)
+
+            do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GitHubStub(Stub):
+    """Stand-in for the github repos, releases, pulls and statuses endpoints.
+
+    The contexts of a commit are pending until its combined status has been
+    polled finish_after times, then succeed one after the other.
+    """
+
+    failure_paths = r'/commits/[^/]+/(status|check-runs)$'
+
+    def __init__(self, **kwargs):
+        super(GitHubStub, self).__init__(**kwargs)
+        self.releases = {}
+        self.assets = {}
+        self.commits = {}
+        self.ids = 0
+
+        repo = r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)'
+        self.route('GET', repo, self.get_repo)
+        self.route('POST', repo + '/releases', self.create_release)
+        self.route('GET', repo + '/releases/tags/(?P<tag>[^/]+)', self.get_release)
+        self.route('GET', repo + r'/releases/(?P<id>\d+)/assets', self.list_assets)
+        self.route('DELETE', repo + r'/releases/assets/(?P<id>\d+)', self.delete_asset)
+        self.route('POST', '/uploads' + repo + r'/releases/(?P<id>\d+)/assets', self.upload)
+        self.route('GET', repo + r'/pulls/(?P<number>\d+)', self.get_pull)
+        self.route('GET', repo + '/commits/(?P<sha>[^/]+)/status', self.get_status)
+        self.route('GET', repo + '/commits/(?P<sha>[^/]+)/check-runs', self.get_check_runs)
+
+    def next_id(self):
+        with self.lock:
+            self.ids += 1
+            return self.ids
+
+    def repo_url(self, match):
+        return '{}/repos/{}/{}'.format(self.url, match.group('owner'), match.group('repo'))
+
+    def get_repo(self, match, query, data):
+        owner, name = match.group('owner'), match.group('repo')
+        return 200, {}, {'id': 1, 'name': name, 'full_name': '{}/{}'.format(owner, name),
+                         'owner': {'login': owner}, 'url': self.repo_url(match)}
+
+    def release_json(self, match, release):
+        url = '{}/releases/{}'.format(self.repo_url(match), release['id'])
+        return dict(release, url=url, assets_url='{}/assets'.format(url),
+                    upload_url='{}/uploads/repos/{}/{}/releases/{}/assets{{?name,label}}'
+                    .format(self.url, match.group('owner'), match.group('repo'), release['id']))
+
+    def create_release(self, match, query, data):
+        release = json.loads(data.decode('utf-8'))
+        release['id'] = self.next_id()
+        with self.lock:
+            self.releases[release['tag_name']] = release
+            self.assets[release['id']] = []
+        return 201, {}, self.release_json(match, release)
+
+    def get_release(self, match, query, data):
+        release = self.releases.get(match.group('tag'))
+        if release is None:
+            return 404, {}, {'message': 'Not Found'}
+        return 200, {}, self.release_json(match, release)
+
+    def list_assets(self, match, query, data):
+        return 200, {}, list(self.assets.get(int(match.group('id')), []))
+
+    def delete_asset(self, match, query, data):
+        asset_id = int(match.group('id'))
+        with self.lock:
+            for assets in self.assets.values():
+                assets[:] = [a for a in assets if a['id'] != asset_id]
+        return 204, {}, None
+
+    def upload(self, match, query, data):
+        asset_id = self.next_id()
+        asset = {'id': asset_id, 'name': query['name'][0],
+                 'label': query.get('label', [''])[0], 'size': len(data), 'state': 'uploaded',
+                 'url': '{}/releases/assets/{}'.format(self.repo_url(match), asset_id)}
+        with self.lock:
+            self.assets[int(match.group('id'))].append(asset)
+        return 201, {}, asset
+
+    def add_pull(self, number, sha, contexts, finish_after=3):
+        with self.lock:
+            self.commits[sha] = {'number': number, 'contexts': list(contexts), 'polls': 0,
+                                 'finish_after': finish_after,
+                                 'created': datetime.utcnow().strftime(DATE_FORMAT)}
+
+    def get_pull(self, match, query, data):
+        number = int(match.group('number'))
+        sha = [s for s, c in self.commits.items() if c['number'] == number][0]
+        return 200, {}, {'id': number, 'number': number, 'state': 'open',
+                         'url': '{}/pulls/{}'.format(self.repo_url(match), number),
+                         'statuses_url': '{}/statuses/{}'.format(self.repo_url(match), sha),
+                         'head': {'sha': sha, 'ref': 'bench'}}
+
+    def get_status(self, match, query, data):
+        commit = self.commits[match.group('sha')]
+        with self.lock:
+            commit['polls'] += 1
+            polls = commit['polls']
+        statuses = []
+        for i, context in enumerate(commit['contexts']):
+            done = polls > commit['finish_after'] + i
+            # Like github, a new state of a context is a new status
+            statuses.append({'id': (1000 if done else 0) + i + 1, 'context': context,
+                             'state': 'success' if done else 'pending',
+                             'created_at': commit['created'], 'updated_at': commit['created'],
+                             'description': self.padding})
+        return 200, {}, {'state': 'pending', 'sha': match.group('sha'), 'statuses': statuses}
+
+    def get_check_runs(self, match, query, data):
+        return 200, {}, {'total_count': 0, 'check_runs': []}
+
+
+class DockerHubStub(Stub):
+    """Stand-in for the Docker Hub buildhistory and trigger endpoints.
+
+    Each repo has a history of builds, newest first, in which the latest
+    build of every tag is spread out. Those builds are building until the
+    history of the repo has been fetched finish_after times, then succeed.
+    """
+
+    failure_paths = r'/buildhistory/$'
+
+    def __init__(self, **kwargs):
+        super(DockerHubStub, self).__init__(**kwargs)
+        self.repos = {}
+        self.route('GET', r'/v2/repositories/(?P<user>[^/]+)/(?P<repo>[^/]+)/buildhistory/',
+                   self.get_history)
+        self.route('POST', r'/u/(?P<user>[^/]+)/(?P<repo>[^/]+)/trigger/(?P<token>[^/]+)/',
+                   self.trigger)
+
+    def add_repo(self, repo, tags, history=50, finish_after=3):
+        builds = []
+        # Tags are rebuilt often, so their latest builds are among the most recent
+        spacing = min(max(history // max(len(tags), 1), 1), LATEST_SPACING)
+        for i in range(history):
+            tag = tags[i // spacing] if i % spacing == 0 and i // spacing < len(tags) \
+                else 'old-{}'.format(i)
+            builds.append({'id': history - i, 'build_code': '{}-{}'.format(repo, i),
+                           'dockertag_name': tag, 'status': SUCCESS,
+                           'watched': tag in tags})
+        with self.lock:
+            self.repos[repo] = {'builds': builds, 'fetches': 0, 'finish_after': finish_after}
+
+    def get_history(self, match, query, data):
+        repo = self.repos.get('{}/{}'.format(match.group('user'), match.group('repo')))
+        if repo is None:
+            return 404, {}, {'detail': 'Not found'}
+        page_size = int(query.get('page_size', ['10'])[0])
+        page = int(query.get('page', ['1'])[0])
+        with self.lock:
+            if page == 1:
+                repo['fetches'] += 1
+            done = repo['fetches'] > repo['finish_after']
+
+        start = (page - 1) * page_size
+        results = []
+        for build in repo['builds'][start:start + page_size]:
+            status = BUILDING if build['watched'] and not done else build['status']
+            results.append({'id': build['id'], 'build_code': build['build_code'],
+                            'dockertag_name': build['dockertag_name'], 'status': status,
+                            'padding': self.padding})
+        next_page = None
+        if start + page_size < len(repo['builds']):
+            next_page = '{}/v2/repositories/{}/{}/buildhistory/?page_size={}&page={}'.format(
+                self.url, match.group('user'), match.group('repo'), page_size, page + 1)
+        return 200, {}, {'count': len(repo['builds']), 'next': next_page, 'results': results}
+
+    def trigger(self, match, query, data):
+        return 200, {}, {}
+
+
+class RegistryStub(Stub):
+    """Stand-in for the manifests, blobs and token endpoints of a Registry v2.
+
+    Like Docker Hub, every /v2/ request needs a bearer token for the scope
+    of its repository, handed out by the realm of a 401's challenge, and
+    pushes need a token with the push action. Images are added with a
+    config, optionally behind a manifest list of several platforms.
+    """
+
+    def __init__(self, **kwargs):
+        super(RegistryStub, self).__init__(**kwargs)
+        self.manifests = {}
+        self.blobs = {}
+        self.token_requests = 0
+        self.puts = 0
+
+        manifest = r'/v2/(?P<name>.+)/manifests/(?P<reference>[^/]+)'
+        self.route('GET', '/token', self.token)
+        self.route('GET', manifest, self.get_manifest)
+        self.route('HEAD', manifest, self.get_manifest)
+        self.route('PUT', manifest, self.put_manifest)
+        self.route('GET', r'/v2/(?P<name>.+)/blobs/(?P<digest>[^/]+)', self.get_blob)
+
+    def authorize(self, method, path, headers):
+        if not path.startswith('/v2/'):
+            return None
+        name = re.match(r'/v2/(.+)/(manifests|blobs)/', path).group(1)
+        scope = (headers.get('Authorization') or '').replace('Bearer stub-', '', 1).split(':')
+        if scope[1:2] == [name] and (method != 'PUT' or 'push' in scope[-1].split(',')):
+            return None
+        challenge = 'Bearer realm="{}/token",service="stub",scope="repository:{}:pull"' \
+            .format(self.url, name)
+        return 401, {'WWW-Authenticate': challenge}, {'errors': [{'code': 'UNAUTHORIZED'}]}
+
+    def token(self, match, query, data):
+        with self.lock:
+            self.token_requests += 1
+        return 200, {}, {'token': 'stub-{}'.format(query['scope'][0])}
+
+    def add_blob(self, body):
+        digest = 'sha256:{}'.format(hashlib.sha256(body).hexdigest())
+        with self.lock:
+            self.blobs[digest] = body
+        return digest
+
+    def add_manifest(self, name, reference, media_type, manifest):
+        body = json.dumps(manifest).encode('utf-8')
+        digest = 'sha256:{}'.format(hashlib.sha256(body).hexdigest())
+        with self.lock:
+            for ref in (reference, digest):
+                self.manifests[(name, ref)] = (media_type, body)
+        return digest
+
+    def add_image(self, name, tag, config, platforms=None):
+        """Add an image with the config under tag, returns the digest of its manifest.
+
+        With platforms, e.g. {'amd64': config, 'arm64': other}, tag points at
+        a manifest list of one image per platform instead.
+        """
+        if platforms:
+            entries = []
+            for architecture in sorted(platforms):
+                digest = self.add_image(name, None, platforms[architecture])
+                entries.append({'digest': digest, 'mediaType': MANIFEST_TYPE,
+                                'platform': {'os': 'linux', 'architecture': architecture}})
+            return self.add_manifest(name, tag, LIST_TYPE, {'schemaVersion': 2,
+                                                            'mediaType': LIST_TYPE,
+                                                            'manifests': entries})
+
+        blob = json.dumps({'config': config}).encode('utf-8')
+        return self.add_manifest(name, tag, MANIFEST_TYPE, {
+            'schemaVersion': 2, 'mediaType': MANIFEST_TYPE, 'layers': [],
+            'config': {'mediaType': CONFIG_TYPE, 'size': len(blob),
+                       'digest': self.add_blob(blob)}})
+
+    def get_manifest(self, match, query, data):
+        manifest = self.manifests.get((match.group('name'), match.group('reference')))
+        if manifest is None:
+            return 404, {}, {'errors': [{'code': 'MANIFEST_UNKNOWN'}]}
+        media_type, body = manifest
+        digest = 'sha256:{}'.format(hashlib.sha256(body).hexdigest())
+        return 200, {'Content-Type': media_type, 'Docker-Content-Digest': digest}, body
+
+    def put_manifest(self, match, query, data):
+        # Schema 2 manifests name their own media type
+        media_type = json.loads(data.decode('utf-8')).get('mediaType')
+        with self.lock:
+            self.puts += 1
+            self.manifests[(match.group('name'), match.group('reference'))] = (media_type, data)
+        return 201, {'Docker-Content-Digest':
+                     'sha256:{}'.format(hashlib.sha256(data).hexdigest())}, b''
+
+    def get_blob(self, match, query, data):
+        blob = self.blobs.get(match.group('digest'))
+        if blob is None:
+            return 404, {}, {'errors': [{'code': 'BLOB_UNKNOWN'}]}
+        return 200, {'Content-Type': 'application/octet-stream'}, blob
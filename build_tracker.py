@@ -0,0 +1,168 @@
+import os
+import json
+import logging as log
+from time import time
+
+from metrics import get_metrics
+
+QUEUED, BUILDING = 'QUEUED', 'BUILDING'
+# States in which a build is over
+FINISHED = ('SUCCESS', 'ERROR', 'CANCELLED')
+# Most recent builds of a repo or tag whose durations predict the next ones
+HISTORY_WINDOW = 20
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+class Build(object):
+    """The states a build was seen in, as (state, time first seen) pairs."""
+
+    def __init__(self, repo, tag, code):
+        self.repo = repo
+        self.tag = tag
+        self.code = code
+        self.transitions = []
+
+    @property
+    def state(self):
+        return self.transitions[-1][0] if self.transitions else None
+
+    def entered(self, state):
+        for s, at in self.transitions:
+            if s == state:
+                return at
+        return None
+
+    @property
+    def queued(self):
+        return self.entered(QUEUED)
+
+    @property
+    def started(self):
+        # A build first seen building started at most then
+        return self.entered(BUILDING)
+
+    @property
+    def finished(self):
+        return self.transitions[-1][1] if self.state in FINISHED else None
+
+    def queue_wait(self):
+        if self.queued is None or self.started is None:
+            return None
+        return self.started - self.queued
+
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def record(self):
+        return {'repo': self.repo, 'tag': self.tag, 'build_code': self.code,
+                'result': self.state, 'finished': self.finished,
+                'queue_wait': self.queue_wait(), 'duration': self.duration()}
+
+
+class BuildTracker(object):
+    """Tracks the state transitions of watched builds, by build code.
+
+    Transition times are those of the poll that first saw each state, so
+    they are late by at most one poll interval. Finished builds are appended
+    to history_path, one json object per line, and the durations read back
+    from it predict when running builds of the same repo and tag complete.
+    """
+
+    def __init__(self, history_path=None, clock=time):
+        self.history_path = history_path
+        self.clock = clock
+        self.builds = {}
+        self.durations = {}
+        self.queue_waits = {}
+        if history_path and os.path.exists(history_path):
+            self.load(history_path)
+
+    def load(self, path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    self._learn(json.loads(line))
+                except ValueError:
+                    log.warn('Skipping a malformed line of build history {}.'.format(path))
+
+    def _learn(self, record):
+        for key in ((record['repo'], record.get('tag')), (record['repo'], None)):
+            for samples, value in ((self.durations, record.get('duration')),
+                                   (self.queue_waits, record.get('queue_wait'))):
+                if value is not None and record.get('result') == 'SUCCESS':
+                    window = samples.setdefault(key, [])
+                    window.append(value)
+                    del window[:-HISTORY_WINDOW]
+
+    def observe(self, repo, tag, code, state):
+        """Record the state a build was seen in, returns True if it changed."""
+        build = self.builds.get(code)
+        if build is None:
+            build = self.builds[code] = Build(repo, tag, code)
+        if build.state == state:
+            return False
+
+        build.transitions.append((state, self.clock()))
+        log.debug('{}: build {} is {}.'.format(repo, code, state))
+        # Builds already over when first seen say nothing about how long builds take
+        if state in FINISHED and len(build.transitions) > 1:
+            self._finish(build)
+        return True
+
+    def _finish(self, build):
+        record = build.record()
+        if record['queue_wait'] is not None:
+            get_metrics().observe('build_queue_seconds', record['queue_wait'], repo=build.repo)
+        if record['duration'] is not None:
+            get_metrics().observe('build_duration_seconds', record['duration'], repo=build.repo)
+        self._learn(record)
+        if self.history_path:
+            with open(self.history_path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def typical(self, samples, repo, tag):
+        window = samples.get((repo, tag)) or samples.get((repo, None))
+        return median(window) if window else None
+
+    def expected_finish(self, code):
+        """When a queued or running build should finish, or None if unknown."""
+        build = self.builds.get(code)
+        if build is None or build.state in FINISHED:
+            return None
+        duration = self.typical(self.durations, build.repo, build.tag)
+        if duration is None:
+            return None
+        if build.started is not None:
+            return build.started + duration
+        wait = self.typical(self.queue_waits, build.repo, build.tag)
+        return build.queued + (wait or 0) + duration if build.queued is not None else None
+
+    def next_due(self, codes):
+        """The earliest expected finish of the builds, None unless all are known."""
+        due = [self.expected_finish(code) for code in codes]
+        if not due or None in due:
+            return None
+        return min(due)
+
+    def summary(self):
+        lines = []
+        for code in sorted(self.builds):
+            build = self.builds[code]
+            if len(build.transitions) < 2:
+                continue
+            path = ' -> '.join(state for state, _ in build.transitions)
+            lines.append('{} {} ({}): {}, queued {}, built in {}'.format(
+                build.repo, build.tag, code, path, format_seconds(build.queue_wait()),
+                format_seconds(build.duration())))
+        return lines
+
+
+def format_seconds(seconds):
+    return '{:.0f}s'.format(seconds) if seconds is not None else 'n/a'
@@ -0,0 +1,161 @@
+#!/usr/bin/python2
+import os
+import mmap
+import hashlib
+import argparse
+import logging as log
+
+from metrics import get_metrics
+from json_cache import JsonCache
+from thread_pool import pool_map
+
+CHECKSUM_FILENAME = 'SHA256-CHECKSUM'
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'oshinko-release', 'sha256.json')
+
+# hashlib releases the GIL on large updates, so threads hash files in parallel
+WORKERS = 4
+BLOCK_SIZE = 1 << 20
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Create a SHA256-CHECKSUM file for a set of '
+                                                 'release assets.')
+
+    parser.add_argument('files', metavar='FILE', type=str, nargs='+',
+                        help='the files to checksum.')
+
+    parser.add_argument('-o', dest='output', type=str, default=None,
+                        help='write the checksums to this file instead of stdout.')
+
+    parser.add_argument('-c', dest='cache', type=str, default=CACHE_PATH,
+                        help='the digest cache file (Default {}).'.format(CACHE_PATH))
+
+    parser.add_argument('-n', dest='no_cache', action='store_true',
+                        help='do not read or update the digest cache.')
+
+    parser.add_argument('-w', dest='workers', type=int, default=WORKERS,
+                        help='the number of files hashed concurrently (Default {}).'
+                        .format(WORKERS))
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+
+    cache = None if args.no_cache else args.cache
+    return args.files, args.output, cache, args.workers
+
+
+class DigestCache(JsonCache):
+    """Persistent map of file -> sha256, valid while the file's stat is unchanged.
+
+    Entries are keyed by absolute path and only trusted if the size, mtime and
+    inode of the file still match those recorded when it was hashed.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        super(DigestCache, self).__init__(path)
+
+    @staticmethod
+    def stat_key(st):
+        return [st.st_size, st.st_mtime, st.st_ino]
+
+    def get(self, filename):
+        filename = os.path.abspath(filename)
+        entry = self.get_entry(filename)
+        if entry and entry['stat'] == self.stat_key(os.stat(filename)):
+            return entry['sha256']
+        return None
+
+    def put(self, filename, digest, st=None):
+        filename = os.path.abspath(filename)
+        st = st if st is not None else os.stat(filename)
+        self.put_entry(filename, {'stat': self.stat_key(st), 'sha256': digest})
+
+    def prune(self):
+        # Forget files that no longer exist
+        for filename in list(self.entries):
+            if not os.path.exists(filename):
+                del self.entries[filename]
+
+
+_cache = None
+
+
+def configure(path=CACHE_PATH):
+    """Replace the shared digest cache, e.g. to keep it elsewhere."""
+    global _cache
+    _cache = DigestCache(path)
+    return _cache
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DigestCache()
+    return _cache
+
+
+def sha256_file(filename, block_size=BLOCK_SIZE):
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        try:
+            # Hash straight from the page cache instead of copying blocks into python
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            # Empty files and special files can not be mapped
+            for block in iter(lambda: f.read(block_size), b''):
+                sha256.update(block)
+        else:
+            try:
+                sha256.update(mapped)
+            finally:
+                mapped.close()
+    return sha256.hexdigest()
+
+
+def checksum_files(filenames, workers=WORKERS, cache=None):
+    """Return the sha256 of each file, in order, hashing uncached files in parallel."""
+    def checksum(filename):
+        st = os.stat(filename)
+        digest = cache.get(filename) if cache else None
+        if digest is None:
+            with get_metrics().timer('checksum_duration_seconds'):
+                digest = sha256_file(filename)
+            get_metrics().inc('checksum_bytes_total', st.st_size)
+            if cache:
+                get_metrics().inc('checksum_cache_misses_total')
+                cache.put(filename, digest, st)
+        else:
+            get_metrics().inc('checksum_cache_hits_total')
+            log.debug('Using cached checksum for {}'.format(filename))
+        return digest
+
+    digests = pool_map(checksum, filenames, workers)
+    if cache:
+        cache.save()
+    return digests
+
+
+def format_checksums(filenames, digests):
+    checksum_data = ''
+    for filename, digest in zip(filenames, digests):
+        checksum_data += '{} *{}\n'.format(digest, os.path.basename(filename))
+    return checksum_data
+
+
+def main():
+    files, output, cache_path, workers = get_opts()
+    cache = DigestCache(cache_path) if cache_path else None
+
+    checksum_data = format_checksums(files, checksum_files(files, workers, cache))
+
+    if output:
+        with open(output, 'w') as f:
+            f.write(checksum_data)
+        log.info('Checksums for {} files written to {}.'.format(len(files), output))
+    else:
+        print(checksum_data.rstrip('\n'))
+
+
+if __name__ == "__main__":
+    main()
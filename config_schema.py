@@ -31,7 +31,9 @@ schema = {
             'schema': {
                 "Content-Type": {'type': 'string', 'required': True},
                 "name": {'type': 'string', 'required': True},
-                "label": {'type': 'string', 'required': True}
+                "label": {'type': 'string', 'required': True},
+                "size": {'type': 'integer', 'required': False, 'min': 0},
+                "sha256": {'type': 'string', 'required': False, 'regex': '^[0-9a-f]{64}$'}
             }
         }
     }
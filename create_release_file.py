@@ -1,9 +1,27 @@
 #!/usr/bin/python2
-from ruamel.yaml import YAML
-from ruamel.yaml.comments import CommentedMap
+from lazy_import import lazy_module
+from checksum import CACHE_PATH, checksum_files, get_cache
+from fnmatch import fnmatch
+from json_cache import JsonCache
+from thread_pool import pool_map
 import os
 import argparse
-import magic
+import threading
+import logging as log
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+MIME_CACHE_PATH = os.path.join(os.path.dirname(CACHE_PATH), 'mime.json')
+
+# libmagic is called through ctypes without the GIL, so threads detect types in parallel
+WORKERS = 4
+
+ruamel_yaml = lazy_module('ruamel.yaml')
+ruamel_comments = lazy_module('ruamel.yaml.comments')
+magic = lazy_module('magic')
 
 
 def get_opts():
@@ -38,10 +56,27 @@ def get_opts():
 
     parser.add_argument('-a', dest='assets', type=str, default=None,
                         help='path to dir containing asset files for this release, note all files '
-                             'in this directory will be used as asset files so ensure only assets '
-                             'exist in this directory.')
+                             'in this directory and its subdirectories will be used as asset '
+                             'files unless filtered with [-i] or [-x].')
+
+    parser.add_argument('-i', dest='include', type=str, default=None, nargs='+',
+                        help='only use assets whose name or path relative to [-a] matches one of '
+                             'these globs (e.g. "*.tar.gz").')
+
+    parser.add_argument('-x', dest='exclude', type=str, default=None, nargs='+',
+                        help='skip assets whose name or path relative to [-a] matches one of '
+                             'these globs.')
+
+    parser.add_argument('-s', dest='checksums', action='store_true',
+                        help='record the sha256 of each asset so git_release need not hash it.')
+
+    parser.add_argument('-w', dest='workers', type=int, default=WORKERS,
+                        help='the number of assets inspected concurrently (Default {}).'
+                        .format(WORKERS))
 
     args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
     version = args.version
     body = args.body
 
@@ -53,20 +88,97 @@ def get_opts():
     prerelease = args.prerelease
     assets = args.assets
     destination = args.destination
-
-    return version, body, tag_name, name, target_commit, draft, prerelease, assets, destination
-
-
-def main():
-    version, body, tag_name, name, target_commit, draft, prerelease, asset_path, dest = get_opts()
-
+    asset_opts = {'include': args.include, 'exclude': args.exclude,
+                  'checksums': args.checksums, 'workers': args.workers}
+
+    return version, body, tag_name, name, target_commit, draft, prerelease, assets, destination, \
+        asset_opts
+
+
+class MimeCache(JsonCache):
+    """Persistent map of file -> content type, keyed by extension and stat.
+
+    The key holds the extension, size, mtime and inode of a file, so an entry
+    survives the asset directory being moved but not the file being changed.
+    """
+
+    def __init__(self, path=MIME_CACHE_PATH):
+        super(MimeCache, self).__init__(path)
+
+    @staticmethod
+    def key(filename, st):
+        extension = os.path.splitext(filename)[1].lower()
+        return '{} {} {} {}'.format(extension, st.st_size, st.st_mtime, st.st_ino)
+
+    def get(self, filename, st):
+        return self.get_entry(self.key(filename, st))
+
+    def put(self, filename, st, content_type):
+        self.put_entry(self.key(filename, st), content_type)
+
+
+def matches(rel_path, patterns):
+    return any(fnmatch(rel_path, p) or fnmatch(os.path.basename(rel_path), p) for p in patterns)
+
+
+def find_assets(asset_path, include=None, exclude=None):
+    """Walk asset_path, returns (path, stat) of the files passing the globs, sorted by path."""
+    found, stack = [], [asset_path]
+    while stack:
+        for entry in scandir(stack.pop()):
+            if entry.is_dir():
+                stack.append(entry.path)
+                continue
+            rel_path = os.path.relpath(entry.path, asset_path).replace(os.sep, '/')
+            if include and not matches(rel_path, include):
+                continue
+            if exclude and matches(rel_path, exclude):
+                continue
+            found.append((entry.path, entry.stat()))
+    found.sort()
+
+    # Assets are uploaded under their file name, which must be unique in a release
+    names = {}
+    for path, _ in found:
+        other = names.setdefault(os.path.basename(path), path)
+        if other != path:
+            raise ValueError('Assets {} and {} would both be uploaded as {}.'
+                             .format(other, path, os.path.basename(path)))
+    return found
+
+
+def detect_content_types(files, workers=WORKERS, cache=None):
+    """Return the content type of each (path, stat), detecting uncached ones in parallel."""
+    local = threading.local()
+
+    def detect(item):
+        path, st = item
+        content_type = cache.get(path, st) if cache else None
+        if content_type is None:
+            # A libmagic handle must not be shared between threads
+            if not hasattr(local, 'mime'):
+                local.mime = magic.Magic(mime=True)
+            content_type = local.mime.from_file(path)
+            if cache:
+                cache.put(path, st, content_type)
+        return content_type
+
+    content_types = pool_map(detect, files, workers)
+    if cache:
+        cache.save()
+    return content_types
+
+
+def create_release_file(version, body, dest, tag_name=None, name=None, target_commit='master',
+                        draft=False, prerelease=False, asset_path=None, include=None, exclude=None,
+                        checksums=False, workers=WORKERS):
     tag_name = 'v{}'.format(version) if not tag_name else tag_name
     name = 'version {}'.format(version) if not name else name
 
-    yaml = YAML()
+    yaml = ruamel_yaml.YAML()
     yaml.indent(mapping=1)
 
-    data = CommentedMap()
+    data = ruamel_comments.CommentedMap()
 
     with open(body, 'r') as notes:
         notes_read = notes.read()
@@ -78,25 +190,40 @@ def main():
         data['prerelease'] = prerelease
 
     if asset_path:
-        mime = magic.Magic(mime=True)
+        files = find_assets(asset_path, include, exclude)
+        content_types = detect_content_types(files, workers, MimeCache())
+        digests = checksum_files([path for path, _ in files], workers, get_cache()) \
+            if checksums else [None] * len(files)
         data['assets'] = []
 
-        for asset in os.listdir(asset_path):
-            abs_path = os.path.join(asset_path, asset)
-            asset_map = CommentedMap()
-            content_type = mime.from_file(abs_path)
-            label = os.path.basename(asset)
+        for (abs_path, st), content_type, digest in zip(files, content_types, digests):
+            asset_map = ruamel_comments.CommentedMap()
+            label = os.path.basename(abs_path)
 
             asset_map['Content-Type'] = content_type
             asset_map['name'] = abs_path
             asset_map['label'] = label
+            asset_map['size'] = st.st_size
+            if digest:
+                asset_map['sha256'] = digest
 
             data['assets'].append(asset_map)
+        log.info('Found {} assets in {}.'.format(len(files), asset_path))
 
     with open(dest, 'w') as dest:
         yaml.dump(data, dest)
 
 
+def main():
+    version, body, tag_name, name, target_commit, draft, prerelease, asset_path, dest, \
+        asset_opts = get_opts()
+    try:
+        create_release_file(version, body, dest, tag_name, name, target_commit, draft, prerelease,
+                            asset_path, **asset_opts)
+    except ValueError as e:
+        log.error(e)
+        exit(1)
+
+
 if __name__ == "__main__":
     main()
-
@@ -1,14 +1,15 @@
 #!/usr/bin/python2
 import argparse
-import getpass
 import re
-import requests
+import http_cache
+from http_client import get_repo
+from metrics import get_metrics
 from time import sleep, time
 import logging as log
 from datetime import datetime
+from poll_scheduler import PollScheduler, MIN_INTERVAL
 
 # github api v2 build status codes:
-from github import Github, BadCredentialsException
 
 API_ENDPOINT = 'https://api.github.com'
 
@@ -22,6 +23,19 @@ WITHOUT_VERBOSITY = log.INFO
 # All states for a github status
 ERROR, FAILURE, PENDING, SUCCESS = "error", "failure", "pending", "success"
 
+# Check run conclusions, mapped to a github status state
+CHECK_RUN_STATES = {
+    'success': SUCCESS, 'neutral': SUCCESS, 'skipped': SUCCESS,
+    'failure': FAILURE, 'cancelled': FAILURE, 'timed_out': FAILURE,
+    'action_required': FAILURE, 'stale': FAILURE
+}
+
+# Check runs are only served with this media type
+CHECKS_MEDIA_TYPE = 'application/vnd.github.antiope-preview+json'
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+PAGE_SIZE = 100
+
 # Time to wait for ci builds to load for PR tests
 PR_CONTEXT_LOAD_LENGTH = 10
 
@@ -53,15 +67,35 @@ def get_opts():
     parser.add_argument('-hd', dest='head', default="master", type=str,
                         help='the head of the pr, by default master head is used')
     # Watch options
-    parser.add_argument('-i', dest='interval', default=[INTERVAL], type=int,
-                        help='the length of the interval between each poll in seconds'
+    parser.add_argument('-i', dest='interval', default=INTERVAL, type=int,
+                        help='the maximum length of the interval between each poll in seconds,'
+                             ' polls start shorter and back off while nothing changes'
                              ' (Default {}).'.format(INTERVAL))
-    parser.add_argument('-r', dest='retries', default=[RETRIES], type=int,
-                        help='the maximum number of times github is '
-                             'polled for build status updates (Default {}).'.format(RETRIES))
+    parser.add_argument('-r', dest='retries', default=RETRIES, type=int,
+                        help='used with [-i] to derive the deadline when [-dl] is not given'
+                             ' (Default {}).'.format(RETRIES))
+    parser.add_argument('-dl', dest='deadline', default=None, type=int,
+                        help='the total number of seconds to watch the statuses for'
+                             ' (Default interval * retries).')
     parser.add_argument('-s', dest='contexts', default=[], type=str, nargs="+",
                         help='the contexts id to check for')
 
+    parser.add_argument('-wp', dest='webhook_port', default=None, type=int,
+                        help='listen on this port for github status and check_run webhooks and '
+                             'only poll github when none arrive within the interval, [-ws] must '
+                             'be specified.')
+    parser.add_argument('-ws', dest='webhook_secret', default=None, type=str,
+                        help='the secret the github webhook payloads are signed with.')
+
+    parser.add_argument('-c', dest='cache_dir', default=None, type=str,
+                        help='a directory in which to keep polled responses so unchanged ones are '
+                             'revalidated instead of re-downloaded, in memory only by default.')
+
+    parser.add_argument('--metrics', dest='metrics', type=str, default=None,
+                        help='write the time each context spent in each state to this file on '
+                             'exit, as json lines if it ends in .json or .jsonl, as a Prometheus '
+                             'textfile otherwise.')
+
     # General options
     parser.add_argument('-v', '--verbose', help='increase output verbosity', action='store_true')
 
@@ -70,17 +104,28 @@ def get_opts():
     repo, token, version, gh_user, base_branch = \
         args.repo, args.token, args.version, args.user, args.branch
     pr_title, pr_body, pr_head = args.title, args.body, args.head
-    verbose, interval, retries, contexts = args.verbose, args.interval, args.retries, args.contexts
+    verbose, interval, contexts = args.verbose, args.interval, args.contexts
+    deadline = args.deadline if args.deadline is not None else interval * args.retries
+    webhook_port, webhook_secret = args.webhook_port, args.webhook_secret
+
+    if webhook_port is not None and not webhook_secret:
+        parser.error('[-wp] requires a webhook secret to be specified via [-ws].')
 
     # Get logger
     loglevel = WITH_VERBOSITY if verbose else WITHOUT_VERBOSITY
     log.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=loglevel)
     log.getLogger('requests').setLevel(log.WARNING)
 
+    if args.cache_dir:
+        http_cache.configure(path=args.cache_dir)
+
+    if args.metrics:
+        get_metrics().export_at_exit(args.metrics)
+
     validate(parser, repo, token)
 
-    return repo, token, version, gh_user, interval, retries, \
-           contexts, pr_title, pr_body, pr_head, base_branch
+    return repo, token, version, gh_user, interval, deadline, \
+           contexts, pr_title, pr_body, pr_head, base_branch, webhook_port, webhook_secret
 
 
 def validate(parser, repo, token):
@@ -89,94 +134,116 @@ def validate(parser, repo, token):
     if not re.match(pattern, repo):
         parser.error('A malformed repo was provided. Use -h for detailed usage instructions.')
 
-    user, repo = repo.split('/')
-
-    # Check if repo exist
-    head = {'Authorization': 'token {}'.format(token)}
-    r = requests.get('{}/repos/{}/{}'.format(API_ENDPOINT, user, repo), headers=head)
-    if r.status_code >= 400:
-        parser.error('Repo not found, ensure the repo supplied is wellformed and exists: '
-                     '<user>/<repo>')
-
-    data = r.json()
-    log.info('Found repo: {}/{}, Description: {}'.format(data['owner']['login'], data['name'],
-                                                         data['description']))
-
     # Check token syntax
     if re.search(r'[^A-z0-9-]', token):
         parser.error('Token is malformed, please provide a proper token.')
 
 
-# Specify owner if owner != logged in user
-def get_repo(user, repo_name, token, owner=None):
-    if token:
-        github = Github(user, token)
-    else:
-        github = Github(user, getpass.getpass())
+def get_pages(url, head):
+    # Follow the Link headers of a paginated github listing
+    while url:
+        r = http_cache.conditional_get(url, headers=head)
+        yield r
+        url = r.links.get('next', {}).get('url') if r.status_code < 400 else None
 
-    try:
-        if owner is None:
-            repo = github.get_user(user).get_repo(repo_name)
-        else:
-            repo = github.get_user(owner).get_repo(repo_name)
-    except BadCredentialsException:
-        error_msg = 'Bad Github credentials. Ensure a valid user and password/token are provided.'
-        log.error(error_msg)
-        raise BadCredentialsException
 
-    return repo
+def check_run_state(run):
+    if run['status'] != 'completed':
+        return PENDING
+    return CHECK_RUN_STATES.get(run['conclusion'], FAILURE)
 
 
-# Only retrieve the statuses that are created after the PR is created
-def get_status(statuses_url, time_pr_created, token):
+# Retrieve the latest status of each context of a commit, from its combined status
+# and its check runs. Only statuses created after the PR is created are returned.
+def get_status(commit_url, time_pr_created, token):
     # Authorized requests give a higher api rate limit
     # To reduce chances of hitting rate limit, use longer intervals
     head = {'Authorization': 'token {}'.format(token)}
-    r = requests.get(statuses_url, headers=head)
-    statuses = r.json()
-
-    if r.status_code >= 400:
-        log.error('Statuses could not be reached. Ensure the Github rate-limit was not reached.')
-        exit(1)
+    statuses = []
+    for r in get_pages('{}/status?per_page={}'.format(commit_url, PAGE_SIZE), head):
+        if r.status_code >= 400:
+            raise RuntimeError('Statuses could not be reached, github responded with status '
+                               'code {}.'.format(r.status_code))
+        statuses.extend(r.json()['statuses'])
+
+    head['Accept'] = CHECKS_MEDIA_TYPE
+    for r in get_pages('{}/check-runs?per_page={}'.format(commit_url, PAGE_SIZE), head):
+        if r.status_code >= 400:
+            log.debug('Check runs could not be reached, github responded with status code {}.'
+                      .format(r.status_code))
+            break
+        for run in r.json()['check_runs']:
+            # Queued runs have not started, so have no time to compare with the PR's yet
+            if not run['started_at']:
+                continue
+            statuses.append({
+                'id': run['id'],
+                'context': run['name'],
+                'state': check_run_state(run),
+                'created_at': run['started_at'],
+                'updated_at': run['completed_at'] or run['started_at']
+            })
 
     if not statuses:
-        log.error('No success events found within statuses_url.')
-        exit(1)
+        raise RuntimeError('No success events found for commit {}.'.format(commit_url))
+
+    return latest_statuses(statuses, time_pr_created)
 
-    date_format = '%Y-%m-%dT%H:%M:%SZ'
-    statuses = filter(lambda status:
-                      datetime.strptime(status['created_at'], date_format) > time_pr_created,
-                      statuses)
 
-    return statuses
+# Reduce statuses to the most recent one of each context created after the PR
+def latest_statuses(statuses, time_pr_created):
+    # Timestamps are all UTC in the same format, so they compare as strings
+    since = time_pr_created.strftime(DATE_FORMAT)
+    latest = {}
+    for status in statuses:
+        if status['created_at'] <= since:
+            continue
+        context = status['context']
+        if context not in latest or status['updated_at'] > latest[context]['updated_at']:
+            latest[context] = status
 
+    return list(latest.values())
 
-def create_pr(gh_user, repo_name, token, owner, title, head, base, body):
-    repo = get_repo(gh_user, repo_name, token, owner=owner)
+
+def create_pr(repo, title, head, base, body):
     pull = repo.create_pull(title=title, head=head, base=base, body=body)
     url = pull.url
     log.info('Pull {} successfully created, see details at: {}'.format(pull.number, url))
     return pull
 
 
-def watch_pr_statuses(pull, contexts, interval, retries, time_pr_created, token):
+# If a receiver is given, statuses delivered by webhook are handled as soon as they
+# arrive and github is only polled when no event arrived within the interval.
+def watch_pr_statuses(pull, contexts, interval, deadline, time_pr_created, token,
+                      receiver=None):
     # Wait for PR notifications for contexts to begin builds
     log.info('Waiting {} seconds for the contexts to show up.'.format(PR_CONTEXT_LOAD_LENGTH))
     sleep(PR_CONTEXT_LOAD_LENGTH)
 
-    statuses_url = pull.raw_data['statuses_url']
+    # The combined status and check runs of the PR head live under its commit
+    commit_url = pull.raw_data['statuses_url'].replace('/statuses/', '/commits/')
 
     # Loop through all the statuses to ensure that each context has passed
     contexts_succeeded = []
     contexts_queue = contexts[:]
     all_contexts_succeeded = False
-    log.info("Polling github for status updates every {} seconds for a maximum of {} times..."
-             .format(interval, retries))
-    retries_left = retries
-    while not all_contexts_succeeded and retries_left > 0:
-        log.info("Polling github for statuses on PR {}, attempt # {}"
-                 .format(pull.number, retries - retries_left + 1))
-        statuses = get_status(statuses_url, time_pr_created, token)
+    seen = {}
+    log.info("Polling github for status updates at most every {} seconds for up to {} seconds..."
+             .format(interval, deadline))
+    schedule = PollScheduler(deadline, max_interval=interval,
+                             min_interval=interval if receiver else MIN_INTERVAL)
+    woken = False
+    while not all_contexts_succeeded and not schedule.expired():
+        if woken:
+            log.info("Received status events for PR {}".format(pull.number))
+            statuses = latest_statuses(receiver.drain(), time_pr_created)
+        else:
+            log.info("Polling github for statuses on PR {}, attempt # {}"
+                     .format(pull.number, schedule.attempts + 1))
+            statuses = get_status(commit_url, time_pr_created, token)
+            if receiver:
+                receiver.drain()
+        latest = {}
         for status in statuses:
             context_found, state_found = status['context'], status['state']
 
@@ -184,10 +251,19 @@ def watch_pr_statuses(pull, contexts, interval, retries, time_pr_created, token)
             if context_found not in contexts_queue:
                 continue
 
+            latest[context_found] = state_found
+            get_metrics().state('pr_context_state_seconds_total', state_found,
+                                pull=pull.number, context=context_found)
+
+            # Skip statuses already handled by a previous poll
+            marker = (status['id'], status['updated_at'])
+            if seen.get(context_found) == marker:
+                continue
+            seen[context_found] = marker
+
             if state_found == FAILURE or state_found == ERROR:
-                log.error('The context: {}, was found to be in state: {}, exiting.'
-                          .format(context_found, state_found))
-                exit(1)
+                raise RuntimeError('The context: {}, was found to be in state: {}.'
+                                   .format(context_found, state_found))
 
             # Add to the pool of succeeded contexts
             if state_found == SUCCESS and context_found not in contexts_succeeded:
@@ -198,47 +274,62 @@ def watch_pr_statuses(pull, contexts, interval, retries, time_pr_created, token)
         if len(contexts_succeeded) == len(contexts):
             all_contexts_succeeded = True
         else:
-            sleep(interval)
-            retries_left -= 1
+            schedule.observe(sorted(latest.items()) + sorted(contexts_succeeded),
+                             busy=PENDING in latest.values())
+            woken = schedule.wait(wake=receiver.event if receiver else None)
 
     if not all_contexts_succeeded:
-        log.error('One of the contexts was not in success state. No merge initiated.')
-        exit(1)
-
-    return 0
+        raise RuntimeError('One of the contexts was not in success state.')
 
 
 def merge_pr(pull):
     pr_merge_status = pull.merge().merged
-    if pr_merge_status:
-        log.info('Merge action performed successfully.')
-    else:
-        log.error('Merge failed, exiting.')
-        exit(1)
+    if not pr_merge_status:
+        raise RuntimeError('Merge of PR {} failed.'.format(pull.number))
+    log.info('Merge action performed successfully.')
 
 
-def main():
-    repo, token, version, gh_user, interval, retries, contexts, title, body, head, base = get_opts()
-    owner, repo_name = repo.split('/')
-
-    # Create PR
-    pull = create_pr(gh_user, repo_name, token, owner, title, head, base, body)
+# Create a PR on repo, wait for its contexts to succeed and merge it
+def create_and_merge_pr(repo, token, title, head, base, body, contexts, interval, deadline,
+                        receiver_opts=None):
+    pull = create_pr(repo, title, head, base, body)
     time_pr_created = datetime.utcnow()
 
     if not contexts:
-        log.info('No contexts provided to watch, exiting.')
-        return
+        log.info('No contexts provided to watch, the PR is not merged.')
+        return pull
 
-    watch_failed = watch_pr_statuses(pull, contexts, interval, retries, time_pr_created, token)
+    receiver = None
+    if receiver_opts:
+        from webhook import WebhookReceiver
+        port, secret = receiver_opts
+        receiver = WebhookReceiver(port, secret, pull.raw_data['head']['sha'],
+                                   check_run_state).start()
 
-    if watch_failed:
-        log.error('A problem was encountered. The watch ended unsuccessfully.')
-    else:
-        log.info('All context jobs succeeded. Performing merge.')
+    try:
+        watch_pr_statuses(pull, contexts, interval, deadline, time_pr_created, token, receiver)
+    finally:
+        if receiver:
+            receiver.stop()
 
+    log.info('All context jobs succeeded. Performing merge.')
     merge_pr(pull)
+    return pull
 
-    return
+
+def main():
+    repo, token, version, gh_user, interval, deadline, contexts, title, body, head, base, \
+        webhook_port, webhook_secret = get_opts()
+    owner, repo_name = repo.split('/')
+
+    receiver_opts = (webhook_port, webhook_secret) if webhook_port is not None else None
+    try:
+        repo = get_repo(gh_user, repo_name, token, owner=owner)
+        create_and_merge_pr(repo, token, title, head, base, body, contexts, interval, deadline,
+                            receiver_opts)
+    except RuntimeError as e:
+        log.error('{} Exiting.'.format(e))
+        exit(1)
 
 
 if __name__ == "__main__":
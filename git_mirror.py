@@ -0,0 +1,138 @@
+#!/usr/bin/python2
+import os
+import re
+import fcntl
+import argparse
+import subprocess
+import logging as log
+from contextlib import contextmanager
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'oshinko-release', 'git')
+# Only branches and tags are mirrored, not e.g. github's refs/pull/*
+REFSPECS = ['+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*']
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Check out a repo from a local mirror, '
+                                                 'fetching only what changed upstream since the '
+                                                 'mirror was last updated.')
+
+    parser.add_argument('url', metavar='URL', type=str,
+                        help='the url of the repo, e.g. https://github.com/<user>/<repo>.git')
+
+    parser.add_argument('dest', metavar='DEST', type=str,
+                        help='the directory the working tree is created in, it must not exist.')
+
+    parser.add_argument('-c', dest='cache_dir', type=str, default=CACHE_DIR,
+                        help='the directory of the mirrors (Default {}).'.format(CACHE_DIR))
+
+    parser.add_argument('-b', dest='branch', type=str, default=None,
+                        help='the branch to check out (Default the default branch of URL).')
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+
+    if os.path.exists(args.dest):
+        parser.error('DEST {} already exists.'.format(args.dest))
+
+    return args.url, args.dest, args.cache_dir, args.branch
+
+
+def strip_credentials(text):
+    """Remove the credentials of the urls in text, e.g. a git command line."""
+    return re.sub(r'(\w+://)[^/@\s]*@', r'\1', text)
+
+
+def mirror_path(cache_dir, url):
+    """The mirror of a url, e.g. <cache_dir>/github.com/<user>/<repo>.git"""
+    path = re.sub(r'^\w+://', '', strip_credentials(url))
+    # scp-like urls, e.g. git@github.com:<user>/<repo>.git
+    path = re.sub(r'^[^/@]+@', '', path).replace(':', '/').strip('/')
+    if not path.endswith('.git'):
+        path += '.git'
+    return os.path.join(cache_dir, *path.split('/'))
+
+
+def git(*args, **kwargs):
+    log.debug('git {}'.format(' '.join(args)))
+    subprocess.check_call(('git',) + args, **kwargs)
+
+
+def git_output(*args, **kwargs):
+    log.debug('git {}'.format(' '.join(args)))
+    return subprocess.check_output(('git',) + args, **kwargs).decode('utf-8')
+
+
+def default_branch(url):
+    """The branch HEAD of the repo at url points at, or None if it has none."""
+    match = re.search(r'^ref: (refs/heads/\S+)\tHEAD$',
+                      git_output('ls-remote', '--symref', url, 'HEAD'), re.M)
+    return match.group(1) if match else None
+
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on path, so concurrent stages share a mirror safely."""
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def update_mirror(url, cache_dir=CACHE_DIR):
+    """Create or incrementally fetch the bare mirror of url, returns its path.
+
+    The url is passed to each fetch rather than stored in the mirror, so
+    credentials in it are never written to the cache. The mirror's HEAD
+    follows the default branch of url, which clones check out.
+    """
+    path = mirror_path(cache_dir, url)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with locked(path + '.lock'):
+        if not os.path.isdir(path):
+            log.info('Creating the mirror of {} in {}.'.format(strip_credentials(url), path))
+            git('init', '--quiet', '--bare', path)
+        git('fetch', '--quiet', '--prune', url, *REFSPECS, cwd=path)
+        head = default_branch(url)
+        if head:
+            git('symbolic-ref', 'HEAD', head, cwd=path)
+    return path
+
+
+def checkout(url, dest, cache_dir=CACHE_DIR, branch=None):
+    """Create a working tree of url in dest from its up to date mirror.
+
+    The clone is local, its objects hard linked to the mirror's, and its
+    origin is then pointed at url, so pushes go upstream as with a clone of
+    url itself. Commits and tags made in dest never reach the mirror.
+    """
+    path = update_mirror(url, cache_dir)
+    args = ['clone', '--quiet'] + (['--branch', branch] if branch else []) + [path, dest]
+    with locked(path + '.lock'):
+        git(*args)
+    # Cloning a mirror whose HEAD points at no branch succeeds with an empty tree
+    try:
+        git_output('rev-parse', '--quiet', '--verify', 'HEAD', cwd=dest)
+    except subprocess.CalledProcessError:
+        raise RuntimeError('{} has no default branch to check out, use -b.'
+                           .format(strip_credentials(url)))
+    git('remote', 'set-url', 'origin', url, cwd=dest)
+    log.info('Checked out {} in {}.'.format(strip_credentials(url), dest))
+    return dest
+
+
+def main():
+    url, dest, cache_dir, branch = get_opts()
+    try:
+        checkout(url, dest, cache_dir, branch)
+    except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+        log.error(strip_credentials(str(e)))
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,39 @@
 #!/usr/bin/python2
-from github import Github, BadCredentialsException, UnknownObjectException
-from cerberus import Validator
 from config_schema import schema
-from ruamel.yaml import YAML
+from checksum import CHECKSUM_FILENAME, checksum_files, get_cache
+from http_client import get_client, get_repo
+from lazy_import import lazy_module
+from metrics import get_metrics
+from time import time
 import os
 import re
 import tempfile
-import requests
 import argparse
 import logging as log
+import copy
 import json
 import getpass
 import hashlib
 import ntpath
-import magic
+import threading
+from thread_pool import pool_map
+
+github = lazy_module('github')
+cerberus = lazy_module('cerberus')
+ruamel_yaml = lazy_module('ruamel.yaml')
 
 
 API_ENDPOINT = 'https://api.github.com'
 
+# Number of assets uploaded concurrently
+WORKERS = 4
+# Number of batch entries run concurrently
+JOBS = 4
+
 
 def get_opts():
     parser = argparse.ArgumentParser(description='Automate release procedure on github.')
-    parser.add_argument('repo', metavar='R', type=str, nargs=1,
+    parser.add_argument('repo', metavar='R', type=str, nargs='?', default=None,
                         help='a github repo in the format user/repo or org/repo')
 
     group = parser.add_mutually_exclusive_group(required=True)
@@ -31,6 +43,12 @@ def get_opts():
     group.add_argument('-d', dest='tag', type=str, default=None, nargs=1,
                        help='delete a release, requires a tag name.')
 
+    group.add_argument('-b', dest='batch', type=str, default=None,
+                       help='a json file listing several releases to create or delete at once, in '
+                            'the format [{"repo": "user/repo", "config": "release.yaml"}, '
+                            '{"repo": "user/repo", "tag": "v1", "delete_tag": true}]. Entries may '
+                            'also set "resume" and "manifest". Replaces the R argument.')
+
     parser.add_argument('-a', dest='token', type=str, default=None, nargs=1,
                         help='a git hub auth token. Skips user input for authentication if '
                              'provided.')
@@ -40,33 +58,76 @@ def get_opts():
                              'specify their github username here, note that any token provided '
                              'should be assigned to this username.')
 
-    parser.add_argument('-t', dest='deletetag', help='Delete tag with release, [-d] must be '
-                                                     'specified.', action='store_true')
+    parser.add_argument('-w', dest='workers', type=int, default=WORKERS,
+                        help='the number of assets uploaded concurrently (Default {}).'
+                        .format(WORKERS))
+
+    parser.add_argument('-j', dest='jobs', type=int, default=JOBS,
+                        help='the number of [-b] entries run concurrently (Default {}).'
+                        .format(JOBS))
+
+    parser.add_argument('-r', dest='resume', action='store_true',
+                        help='resume a partially created release, only uploading assets that are '
+                             'missing or changed, [-c] or [-b] must be specified. Uploads are '
+                             'recorded in the [-m] manifest of runs given [-r] or [-m], so pass '
+                             'it to the first run too.')
+
+    parser.add_argument('-m', dest='manifest', type=str, default=None,
+                        help='file recording the checksums of uploaded assets, used by [-r] '
+                             '(Default <config>.manifest.json with [-r], none otherwise).')
+
+    parser.add_argument('-t', dest='deletetag', help='Delete tag with release, [-d] or [-b] must '
+                                                     'be specified.', action='store_true')
+
+    parser.add_argument('--metrics', dest='metrics', type=str, default=None,
+                        help='write timings and counters to this file on exit, as json lines if '
+                             'it ends in .json or .jsonl, as a Prometheus textfile otherwise.')
 
     args = parser.parse_args()
     token = args.token[0] if args.token else None
     conf = args.config[0] if args.config else None
     tag = args.tag[0] if args.tag else None
     delete_tag = args.deletetag
-    gh_user = args.gh_user[0]
+    gh_user = args.gh_user[0] if args.gh_user else None
+    workers = args.workers
+    resume = args.resume
 
-    if delete_tag and not tag:
+    if delete_tag and not (tag or args.batch):
         parser.error('[-t] requires a release tag to be specified via [-d].')
 
-    repo = args.repo[0]
+    if resume and not (conf or args.batch):
+        parser.error('[-r] requires a configuration file to be specified via [-c].')
 
     loglevel = log.INFO
     log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=loglevel)
     log.getLogger('requests').setLevel(log.WARNING)
 
-    if conf:
-        validate_yaml(parser, conf)
+    if args.metrics:
+        get_metrics().export_at_exit(args.metrics)
 
-    validate_repo(parser, repo)
+    if args.batch:
+        if args.repo or args.manifest:
+            parser.error('R and [-m] can not be combined with [-b].')
+        with open(args.batch, 'r') as batch:
+            entries = json.load(batch)
+    elif args.repo:
+        entries = [{'repo': args.repo, 'config': conf, 'tag': tag, 'manifest': args.manifest}]
+    else:
+        parser.error('R is required unless [-b] is provided.')
 
-    owner, repo_name = repo.split('/')
+    for entry in entries:
+        if 'repo' not in entry or bool(entry.get('config')) == bool(entry.get('tag')):
+            parser.error('Every entry requires a repo and either a config or a tag.')
+        validate_repo(parser, entry['repo'])
+        if entry.get('config'):
+            validate_yaml(parser, entry['config'])
+        entry.setdefault('resume', resume)
+        # Runs that may be resumed record their uploads next to the config by default
+        if entry.get('config') and entry['resume'] and not entry.get('manifest'):
+            entry['manifest'] = '{}.manifest.json'.format(entry['config'])
+        entry.setdefault('delete_tag', delete_tag)
 
-    return owner, repo_name, conf, token, tag, delete_tag, gh_user
+    return entries, token, gh_user, workers, args.jobs
 
 
 def validate_repo(parser, repo):
@@ -75,37 +136,68 @@ def validate_repo(parser, repo):
     if not re.match(pattern, repo):
         parser.error('A malformed repo was provided. Use -h for detailed usage instructions.')
 
-    user, repo = repo.split('/')
-
-    # Check if repo exist
-    r = requests.get('{}/repos/{}/{}'.format(API_ENDPOINT, user, repo))
-    if r.status_code >= 400:
-        parser.error('Unable to reach repo, ensure the repo supplied is wellformed and exists:'
-                     '<user>/<repo>')
+    # The repo's existence is checked when it is first fetched by get_repo
     return True
 
 
 def validate_yaml(parser, conf):
-    # Ensure file is formatted correctly
-    yaml = YAML()
-    with open(conf, 'r') as config:
-        conf_yaml = yaml.load(config)
-        # cerberus works better on a dict; a simple way to convert yaml -> python dict:
-        conf_dict = json.loads(json.dumps(conf_yaml))
+    try:
+        return load_config(conf) is not None
+    except ValueError as e:
+        parser.error(str(e))
+
 
-    v = Validator(schema)
-    is_valid = v.validate(conf_dict, schema)
-    if not is_valid:
-        raise parser.error('Invalid file format in file {}\nError: {}'.format(conf, v.errors))
+_validator = None
+_configs = {}
+_config_lock = threading.Lock()
 
-    if 'assets' in conf_dict:
-        assets = conf_dict['assets']
-        for asset in assets:
-            if not os.path.exists(asset['name']):
-                raise parser.error('File {} specified for asset with label {} does not exist.'
-                                   .format(asset['label'], asset['name']))
 
-    return is_valid
+def get_validator():
+    # Compiling the schema is the slow part of validation, so it is only done once
+    global _validator
+    if _validator is None:
+        _validator = cerberus.Validator(schema)
+    return _validator
+
+
+def missing_assets(assets):
+    missing = []
+    for asset in assets:
+        try:
+            os.stat(asset['name'])
+        except OSError:
+            missing.append(asset)
+    return missing
+
+
+# Load and validate a release file, raises ValueError if it is not valid
+# Files are parsed and checked against the schema once per content, keyed by their sha256
+def load_config(conf):
+    with open(conf, 'rb') as config:
+        data = config.read()
+    key = hashlib.sha256(data).hexdigest()
+
+    with _config_lock:
+        conf_dict = _configs.get(key)
+        if conf_dict is None:
+            # The safe loader builds plain dicts and lists, using libyaml when available
+            try:
+                conf_dict = ruamel_yaml.YAML(typ='safe').load(data)
+            except ruamel_yaml.YAMLError as e:
+                raise ValueError('Invalid yaml in file {}\nError: {}'.format(conf, e))
+            v = get_validator()
+            if not isinstance(conf_dict, dict) or not v.validate(conf_dict):
+                errors = v.errors if isinstance(conf_dict, dict) else 'not a mapping'
+                raise ValueError('Invalid file format in file {}\nError: {}'.format(conf, errors))
+            _configs[key] = conf_dict
+
+    # Asset files can come and go independently of the release file, so are always checked
+    missing = missing_assets(conf_dict.get('assets', []))
+    if missing:
+        raise ValueError('\n'.join('File {} specified for asset with label {} does not exist.'
+                                   .format(asset['name'], asset['label']) for asset in missing))
+
+    return copy.deepcopy(conf_dict)
 
 
 def path_leaf(path):
@@ -113,25 +205,151 @@ def path_leaf(path):
     return tail or ntpath.basename(head)
 
 
-def sha256_checksum(filename, block_size=65536):
-    sha256 = hashlib.sha256()
-    with open(filename, 'rb') as f:
-        for block in iter(lambda: f.read(block_size), b''):
-            sha256.update(block)
-    return sha256.hexdigest()
+def sha256_checksum(filename):
+    return checksum_files([filename], cache=get_cache())[0]
+
 
+# The sha256 recorded by create_release_file, unless the asset changed size since
+def precomputed_checksum(asset):
+    if asset.get('sha256') and asset.get('size') == os.path.getsize(asset['name']):
+        return asset['sha256']
+    return None
+
+
+def asset_checksums(assets):
+    """Return the sha256 of each asset, only hashing those without a usable precomputed one."""
+    checksums = [precomputed_checksum(asset) for asset in assets]
+    missing = [i for i, checksum in enumerate(checksums) if checksum is None]
+    hashed = checksum_files([assets[i]['name'] for i in missing], cache=get_cache())
+    for i, checksum in zip(missing, hashed):
+        checksums[i] = checksum
+    return checksums
+
+
+def create_checksum_text(assets, checksums=None):
+    if not checksums:
+        checksums = asset_checksums(assets)
 
-def create_checksum_text(assets):
     checksum_data = ''
-    for asset in assets:
-        checksum = sha256_checksum(asset['name'])
+    for asset, checksum in zip(assets, checksums):
         checksum_data += '{} *{}\n'.format(checksum, path_leaf(asset['name']))
     return checksum_data
 
 
+class HashingReader(object):
+    """File wrapper that hashes the data as it is read for an upload."""
+
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+        self.sha256 = hashlib.sha256()
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        block = self.f.read(size)
+        self.sha256.update(block)
+        return block
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+# Streams the asset to the release upload endpoint, hashing it on the way,
+# so the file is only read from disk once. Returns the sha256 of the asset.
+def upload_asset(release, asset, auth):
+    endpoint = release.upload_url.split('{?')[0]
+    params = {'name': path_leaf(asset['name']), 'label': asset['label']}
+    size = os.path.getsize(asset['name'])
+    headers = {'Content-Type': asset['Content-Type'], 'Content-Length': str(size)}
+
+    start = time()
+    with open(asset['name'], 'rb') as f:
+        reader = HashingReader(f, size)
+        r = get_client().post(endpoint, params=params, headers=headers, data=reader,
+                              auth=auth)
+    elapsed = time() - start
+
+    if r.status_code >= 400:
+        error_msg = 'Upload of asset {} failed with status code {}.'\
+            .format(asset['label'], r.status_code)
+        log.error(error_msg)
+        raise IOError(error_msg)
+
+    get_metrics().observe('asset_upload_duration_seconds', elapsed)
+    get_metrics().set('asset_upload_bytes_per_second', size / max(elapsed, 1e-6),
+                      asset=asset['label'])
+    log.info('Asset {} uploaded successfully.'.format(asset['label']))
+    return reader.hexdigest()
+
+
+# Uploads with PyGithub when no auth is available, hashing the asset separately
+def upload_asset_unstreamed(release, asset):
+    checksum = precomputed_checksum(asset) or sha256_checksum(asset['name'])
+    release.upload_asset(
+        asset['name'],
+        asset['label'],
+        asset['Content-Type']
+    )
+    log.info('Asset {} uploaded successfully.'.format(asset['label']))
+    return checksum
+
+
+def upload_assets(release, assets, auth, workers=WORKERS, on_uploaded=None):
+    def upload(asset):
+        if auth:
+            checksum = upload_asset(release, asset, auth)
+        else:
+            checksum = upload_asset_unstreamed(release, asset)
+        get_cache().put(asset['name'], checksum)
+        if on_uploaded:
+            on_uploaded(asset, checksum)
+        return checksum
+
+    if not auth:
+        workers = 1
+    try:
+        return pool_map(upload, assets, workers)
+    finally:
+        get_cache().save()
+
+
+def load_manifest(path, tag_name):
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if manifest.get('tag_name') != tag_name:
+        return {}
+    return manifest.get('assets', {})
+
+
+def save_manifest(path, tag_name, recorded):
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'w') as f:
+        json.dump({'tag_name': tag_name, 'assets': recorded}, f, indent=1, sort_keys=True)
+    os.rename(tmp, path)
+
+
+def file_record(filename, checksum):
+    st = os.stat(filename)
+    return {'size': st.st_size, 'mtime': st.st_mtime, 'sha256': checksum}
+
+
+# An uploaded asset can be kept if it finished uploading, has the local file's size,
+# and the manifest shows the local file is unchanged since it was uploaded.
+def is_uploaded(asset, remote, recorded):
+    if remote is None or recorded is None or remote.state != 'uploaded':
+        return False
+    st = os.stat(asset['name'])
+    return remote.size == st.st_size == recorded['size'] and st.st_mtime == recorded['mtime']
+
+
 # Securely create a temporary checksum asset to uplaod and remove afterwards
 def upload_checksum(data, release, tmpdir):
-    filename = 'SHA256-CHECKSUM'
+    filename = CHECKSUM_FILENAME
     created_new_dir = False
     saved_umask = None
     if not tmpdir:
@@ -162,89 +380,163 @@ def upload_checksum(data, release, tmpdir):
 
 
 # TODO: Add verification release was uploaded successfully
+# When auth (user, token) is provided assets are streamed and hashed concurrently
+# on a pool of workers, otherwise they are hashed then uploaded one at a time.
+# With resume, an existing release for the tag is reused and only assets that are
+# missing, incomplete or changed since the upload recorded in the manifest are sent.
 def create_release(repo, tag_name, name, body, draft, prerelease,
-                   target_commitish, assets=None, tmpdir=''):
+                   target_commitish, assets=None, tmpdir='', auth=None, workers=WORKERS,
+                   resume=False, manifest=None):
     if assets is None:
         assets = []
 
-    log.info('Creating a git release with tag {}.'.format(tag_name))
-    repo.create_git_release(tag_name, name, body, draft, prerelease, target_commitish)
+    release = None
+    if resume:
+        try:
+            release = repo.get_release(tag_name)
+            log.info('Resuming the existing git release with tag {}.'.format(tag_name))
+        except github.UnknownObjectException:
+            log.info('No release with tag {} exists yet, nothing to resume.'.format(tag_name))
+
+    if release is None:
+        log.info('Creating a git release with tag {}.'.format(tag_name))
+        with get_metrics().timer('release_step_duration_seconds', step='create'):
+            repo.create_git_release(tag_name, name, body, draft, prerelease, target_commitish)
 
     if assets:
-        release = repo.get_release(tag_name)
-        checksum_data = create_checksum_text(assets)
+        if release is None:
+            release = repo.get_release(tag_name)
+
+        remote_assets = dict((a.name, a) for a in release.get_assets()) if resume else {}
+        recorded = load_manifest(manifest, tag_name) if manifest else {}
+        lock = threading.Lock()
+
+        def record(asset, checksum):
+            if manifest:
+                with lock:
+                    recorded[path_leaf(asset['name'])] = file_record(asset['name'], checksum)
+                    save_manifest(manifest, tag_name, recorded)
+
+        checksums, pending = [None] * len(assets), []
+        for i, asset in enumerate(assets):
+            leaf = path_leaf(asset['name'])
+            remote = remote_assets.get(leaf)
+            if is_uploaded(asset, remote, recorded.get(leaf)):
+                log.info('Asset {} is already uploaded, skipping.'.format(asset['label']))
+                checksums[i] = recorded[leaf]['sha256']
+                continue
+            if remote is not None:
+                log.info('Replacing incomplete or changed asset {}.'.format(asset['label']))
+                remote.delete_asset()
+            pending.append(i)
 
         log.info('Uploading assets...')
-        for asset in assets:
-            release.upload_asset(
-                asset['name'],
-                asset['label'],
-                asset['Content-Type']
-            )
-            log.info('Asset {} uploaded successfully.'.format(asset['label']))
-        upload_checksum(checksum_data, release, tmpdir)
+        with get_metrics().timer('release_step_duration_seconds', step='upload_assets'):
+            uploaded = upload_assets(release, [assets[i] for i in pending], auth, workers,
+                                     record)
+        for i, checksum in zip(pending, uploaded):
+            checksums[i] = checksum
+        checksum_data = create_checksum_text(assets, checksums)
+
+        remote_checksum = remote_assets.get(CHECKSUM_FILENAME)
+        if remote_checksum is not None and remote_checksum.size == len(checksum_data) \
+                and not pending:
+            log.info('Asset {} is already uploaded, skipping.'.format(CHECKSUM_FILENAME))
+        else:
+            if remote_checksum is not None:
+                remote_checksum.delete_asset()
+            with get_metrics().timer('release_step_duration_seconds', step='upload_checksum'):
+                upload_checksum(checksum_data, release, tmpdir)
 
         log.info('Release successfully created.')
 
 
+def create_release_from_file(repo, conf, **kwargs):
+    conf_dict = load_config(conf)
+
+    tag_name, name, body, draft, prerelease, target_commitish = \
+        conf_dict['tag_name'], conf_dict['name'], conf_dict['body'], \
+        conf_dict['draft'], conf_dict['prerelease'], \
+        conf_dict['target_commitish']
+
+    assets = conf_dict['assets'] if 'assets' in conf_dict else []
+    create_release(repo, tag_name, name, body, draft, prerelease, target_commitish, assets,
+                   **kwargs)
+
+
 def delete_release(tag, delete_tag, repo):
     log.info('Deleting a git release with tag {}.'.format(tag))
 
     try:
         release = repo.get_release(tag)
         release.delete_release()
-    except UnknownObjectException:
+    except github.UnknownObjectException:
         log.error('Release with tag {} was not found.'.format(tag))
-        raise UnknownObjectException
+        raise
 
     if delete_tag:
         log.info('Deleting a git tag {}.'.format(tag))
         repo.get_git_ref(ref='tags/'+tag).delete()
 
 
-# Specify owner if owner != logged in user
-def get_repo(user, repo_name, token, owner=None):
-    if token:
-        github = Github(user, token)
+def entry_action(entry):
+    if entry.get('config'):
+        return 'release from {}'.format(entry['config'])
+    return 'deletion of release {}'.format(entry['tag'])
+
+
+def run_entry(entry, gh_user, token, workers=WORKERS):
+    """Create or delete the release of one batch entry, in the format of [-b]."""
+    owner, repo_name = entry['repo'].split('/')
+    # If a separate gh_user is not provided, owner is assumed as the user performing release
+    user = gh_user if gh_user is not None else owner
+    repo = get_repo(user, repo_name, token, owner)
+
+    if entry.get('config'):
+        create_release_from_file(repo, entry['config'], auth=(user, token), workers=workers,
+                                 resume=entry.get('resume', False), manifest=entry.get('manifest'))
     else:
-        github = Github(user, getpass.getpass())
+        delete_release(entry['tag'], entry.get('delete_tag', False), repo)
 
-    try:
-        if owner is None:
-            repo = github.get_user(user).get_repo(repo_name)
-        else:
-            repo = github.get_user(owner).get_repo(repo_name)
-    except BadCredentialsException:
-        error_msg = 'Bad Github credentials. Ensure a valid user and password/token are provided.'
-        log.error(error_msg)
-        raise BadCredentialsException
 
-    return repo
+def run_batch(entries, gh_user, token, workers=WORKERS, jobs=JOBS):
+    """Run the entries on a pool of jobs, returns the error of each entry or None.
 
+    Entries share the github clients of http_client, whose requests, like
+    the asset uploads, go through the shared client, and so one rate-limit
+    budget per set of credentials and host.
+    """
+    def run(entry):
+        try:
+            run_entry(entry, gh_user, token, workers)
+        except Exception as e:
+            log.error('{} {} failed: {}'.format(entry['repo'], entry_action(entry), e))
+            return e
+        return None
 
-def main():
-    owner, repo_name, conf, token, tag, delete_tag, gh_user = get_opts()
+    return pool_map(run, entries, jobs)
 
-    # If a separate gh_user is not provided, owner is assumed as the user performing release
-    if gh_user is None:
-        gh_user = owner
 
-    repo = get_repo(gh_user, repo_name, token, owner)
+def report(entries, errors):
+    lines = ['{:<40} {:<8} {}'.format('REPO', 'STATUS', 'ACTION')]
+    for entry, error in zip(entries, errors):
+        lines.append('{:<40} {:<8} {}'.format(entry['repo'], 'FAILED' if error else 'OK',
+                                              entry_action(entry)))
+    return '\n'.join(lines)
+
 
-    if conf:
-        yaml = YAML()
-        with open(conf, 'r') as config:
-            conf_yaml = yaml.load(config)
+def main():
+    entries, token, gh_user, workers, jobs = get_opts()
 
-        tag_name, name, body, draft, prerelease, target_commitish = \
-            conf_yaml['tag_name'], conf_yaml['name'], conf_yaml['body'], \
-            conf_yaml['draft'], conf_yaml['prerelease'], \
-            conf_yaml['target_commitish']
+    # Prompt once, the credentials are also used for streaming asset uploads
+    if not token:
+        token = getpass.getpass()
 
-        assets = conf_yaml['assets'] if 'assets' in conf_yaml else []
-        create_release(repo, tag_name, name, body, draft, prerelease, target_commitish, assets)
-    else:
-        delete_release(tag, delete_tag, repo)
+    errors = run_batch(entries, gh_user, token, workers, jobs)
+    if len(entries) > 1:
+        log.info('Batch report:\n{}'.format(report(entries, errors)))
+    if any(errors):
+        exit(1)
 
     return 0
 
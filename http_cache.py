@@ -0,0 +1,175 @@
+import os
+import json
+import hashlib
+import threading
+import logging as log
+from collections import OrderedDict
+
+from http_client import get_client
+from metrics import get_metrics
+
+MAX_ENTRIES = 256
+
+
+class CachedResponse(object):
+    """Minimal stand-in for requests.Response, as returned by conditional_get."""
+
+    def __init__(self, url, status_code, headers, text, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.text)
+
+    @property
+    def links(self):
+        """The parsed Link header, keyed by rel, like requests.Response.links."""
+        header = self.headers.get('Link')
+        if not header:
+            return {}
+        from requests.utils import parse_header_links
+        return dict((link.get('rel') or link.get('url'), link)
+                    for link in parse_header_links(header))
+
+
+class ResponseCache(object):
+    """LRU cache of validated GET responses, optionally persisted to a directory.
+
+    Entries hold the ETag/Last-Modified validators of a response together with
+    its body, so an unchanged resource can be answered from the cache after a
+    304 from the server. When a path is given, entries are also written there
+    so separate processes polling the same URLs share validators; the oldest
+    files are removed once more than max_entries exist.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def key(url, headers):
+        # Different credentials can see different views of the same url
+        auth = (headers or {}).get('Authorization', '')
+        return hashlib.sha1('{} {}'.format(url, auth).encode('utf-8')).hexdigest()
+
+    def count(self, hit):
+        # Polls of several threads revalidate through the same cache
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _file(self, key):
+        return os.path.join(self.path, '{}.json'.format(key))
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                entry = self.entries.pop(key)
+                self.entries[key] = entry
+                return entry
+        if self.path:
+            try:
+                with open(self._file(key), 'r') as f:
+                    entry = json.load(f)
+            except (IOError, OSError, ValueError):
+                return None
+            self._remember(key, entry)
+            return entry
+        return None
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if self.path:
+            tmp = '{}.{}.tmp'.format(self._file(key), os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp, self._file(key))
+            self._evict_files()
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _evict_files(self):
+        files = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.json')]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda f: os.stat(f).st_mtime)
+        for f in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+
+_cache = ResponseCache()
+
+
+def configure(path=None, max_entries=MAX_ENTRIES):
+    """Replace the module cache, e.g. to persist it to a directory."""
+    global _cache
+    _cache = ResponseCache(max_entries=max_entries, path=path)
+    return _cache
+
+
+def get_cache():
+    return _cache
+
+
+def conditional_get(url, headers=None, cache=None, **kwargs):
+    """GET url, revalidating any cached copy with If-None-Match/If-Modified-Since.
+
+    A 304 from the server is answered with the cached body (and does not count
+    against the github rate-limit). Only successful responses carrying a
+    validator are cached; everything else is returned as received.
+    """
+    cache = cache if cache is not None else _cache
+    headers = dict(headers or {})
+    key = cache.key(url, headers)
+    entry = cache.get(key)
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    r = get_client().get(url, headers=headers, **kwargs)
+
+    if r.status_code == 304 and entry:
+        cache.count(hit=True)
+        get_metrics().inc('http_cache_hits_total')
+        log.debug('Not modified, using cached response for {}'.format(url))
+        # Refresh the entry so it is not the first to be evicted
+        cache.put(key, entry)
+        headers = r.headers.copy()
+        if entry.get('link') and 'Link' not in headers:
+            headers['Link'] = entry['link']
+        return CachedResponse(url, entry['status_code'], headers, entry['text'],
+                              from_cache=True)
+
+    cache.count(hit=False)
+    get_metrics().inc('http_cache_misses_total')
+    etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+    if r.status_code == 200 and (etag or last_modified):
+        cache.put(key, {
+            'etag': etag,
+            'last_modified': last_modified,
+            'status_code': r.status_code,
+            'link': r.headers.get('Link'),
+            'text': r.text
+        })
+    return CachedResponse(url, r.status_code, r.headers, r.text)
@@ -0,0 +1,203 @@
+import getpass
+import threading
+import logging as log
+from time import time
+
+from lazy_import import lazy_module
+from metrics import get_metrics
+from rate_limit import RateLimiter, credential_key
+
+requests = lazy_module('requests')
+github = lazy_module('github')
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+# Defaults
+POOL_SIZE = 16
+TIMEOUT = (10, 60)
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+# Times a request rejected by a rate-limit is sent again once the budget allows
+RATE_LIMIT_RETRIES = 3
+
+
+class Client(object):
+    """requests.Session wrapper with keep-alive pools, a default timeout and retries.
+
+    Connections are reused across calls and threads, so polls after the first
+    skip the TCP and TLS handshakes. Only idempotent requests (e.g. GET) are
+    retried, with exponential backoff, on connection errors and 5xx responses.
+    Every request is paced by a RateLimiter, and a request rejected by a
+    rate-limit is sent again once the budget allows instead of failing.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=TIMEOUT, retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR, limiter=None):
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+
+        self.session = requests.Session()
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUSES)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        key = credential_key(kwargs.get('headers'), kwargs.get('auth'))
+        # A streamed body can not be replayed
+        retries = 0 if hasattr(kwargs.get('data'), 'read') else RATE_LIMIT_RETRIES
+
+        while True:
+            self.limiter.acquire(host, key)
+            start = time()
+            r = self.session.request(method, url, **kwargs)
+            record(host, method, r, time() - start, kwargs)
+            if not self.limiter.update(host, key, r) or retries <= 0:
+                return r
+            log.warn('Request to {} was rate-limited, retrying once the budget allows.'
+                     .format(host))
+            retries -= 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+
+def record(host, method, r, elapsed, kwargs):
+    metrics = get_metrics()
+    metrics.observe('http_request_duration_seconds', elapsed, host=host, method=method,
+                    status=r.status_code)
+    data = kwargs.get('data')
+    if data is not None and hasattr(data, '__len__'):
+        metrics.inc('http_sent_bytes_total', len(data), host=host)
+    # Reading the body of a streamed response here would consume it
+    received = r.headers.get('Content-Length') if kwargs.get('stream') else len(r.content)
+    if received is not None:
+        metrics.inc('http_received_bytes_total', int(received), host=host)
+
+
+class GithubConnection(object):
+    """httplib-like connection PyGithub sends its requests through.
+
+    Requests go through the shared Client, so PyGithub's traffic is paced and
+    counted against the same RateLimiter budgets as every other request.
+    """
+
+    protocol = 'https'
+
+    def __init__(self, host, port=None, strict=False, timeout=None, **kwargs):
+        self.url = '{}://{}{}'.format(self.protocol, host, ':{}'.format(port) if port else '')
+        self.timeout = timeout
+        self.pending = None
+
+    def request(self, verb, url, input, headers):
+        self.pending = verb, url, input, headers
+
+    def getresponse(self):
+        verb, url, data, headers = self.pending
+        kwargs = {'timeout': self.timeout} if self.timeout else {}
+        r = get_client().request(verb, self.url + url, data=data, headers=headers,
+                                 allow_redirects=False, **kwargs)
+        return GithubResponse(r)
+
+    def close(self):
+        pass
+
+
+class GithubHTTPConnection(GithubConnection):
+    # e.g. local stand-ins of github
+    protocol = 'http'
+
+
+class GithubResponse(object):
+    def __init__(self, r):
+        self.status = r.status_code
+        self.headers = r.headers
+        self.text = r.text
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def read(self):
+        return self.text
+
+
+_client = None
+_githubs = {}
+_lock = threading.Lock()
+_routed = False
+
+
+def configure(pool_size=POOL_SIZE, timeout=TIMEOUT, retries=RETRIES,
+              backoff_factor=BACKOFF_FACTOR, limiter=None):
+    """Replace the shared client, e.g. to size the pool for more workers."""
+    global _client
+    with _lock:
+        if limiter is None and _client is not None:
+            # Keep the budgets learnt so far
+            limiter = _client.limiter
+        _client = Client(pool_size, timeout, retries, backoff_factor, limiter)
+    return _client
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = Client()
+        return _client
+
+
+def route_github():
+    """Send the requests of the Github clients created from now on through the shared client."""
+    global _routed
+    if not _routed:
+        github.Requester.Requester.injectConnectionClasses(GithubHTTPConnection, GithubConnection)
+        _routed = True
+
+
+def get_github(user, token):
+    """Return a Github client for the credentials, shared by every caller in the process."""
+    route_github()
+    with _lock:
+        key = (user, token)
+        if key not in _githubs:
+            _githubs[key] = github.Github(user, token, timeout=TIMEOUT[1])
+        return _githubs[key]
+
+
+# Specify owner if owner != logged in user
+# Fetching the repo also checks that it exists, so callers need no separate validation
+def get_repo(user, repo_name, token, owner=None):
+    client = get_github(user, token if token else getpass.getpass())
+    owner = user if owner is None else owner
+
+    try:
+        repo = client.get_user(owner).get_repo(repo_name)
+    except github.BadCredentialsException:
+        error_msg = 'Bad Github credentials. Ensure a valid user and password/token are provided.'
+        log.error(error_msg)
+        raise
+    except github.UnknownObjectException:
+        raise RuntimeError('Repo not found, ensure the repo supplied is wellformed and exists: '
+                           '{}/{}'.format(owner, repo_name))
+
+    return repo
@@ -0,0 +1,55 @@
+import os
+import json
+import errno
+import threading
+
+
+class JsonCache(object):
+    """Map persisted as a json file, shared by threads.
+
+    A missing or unreadable file starts an empty cache. save() only writes
+    after changes, to a temporary file renamed over the cache, so readers
+    never see a partial one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.entries = {}
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def get_entry(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def put_entry(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.dirty = True
+
+    def prune(self):
+        """Drop stale entries before saving, called with the lock held."""
+        pass
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.prune()
+            directory = os.path.dirname(self.path)
+            if directory:
+                try:
+                    os.makedirs(directory)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            os.rename(tmp, self.path)
+            self.dirty = False
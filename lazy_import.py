@@ -0,0 +1,28 @@
+import importlib
+
+
+class LazyModule(object):
+    """Stand-in for a module that is only imported on first attribute access.
+
+    Lets the scripts parse arguments (and answer --help) without paying for
+    PyGithub, requests, ruamel.yaml, cerberus or libmagic up front.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self._name)
+
+
+def lazy_module(name):
+    return LazyModule(name)
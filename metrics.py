@@ -0,0 +1,149 @@
+import os
+import json
+import atexit
+import threading
+import logging as log
+from time import time
+from contextlib import contextmanager
+
+COUNTER, GAUGE, HISTOGRAM = 'counter', 'gauge', 'histogram'
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class Metrics(object):
+    """In-process registry of counters, gauges, histograms and time in state.
+
+    Series are identified by a metric name and labels. Recording is cheap and
+    always on; nothing leaves the process unless export (or export_at_exit)
+    is called, writing a Prometheus textfile or one json object per line.
+    """
+
+    def __init__(self, clock=time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.types = {}
+        self.series = {}
+        self.states = {}
+
+    def _key(self, name, kind, labels):
+        self.types.setdefault(name, kind)
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            key = self._key(name, COUNTER, labels)
+            self.series[key] = self.series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.series[self._key(name, GAUGE, labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = self._key(name, HISTOGRAM, labels)
+            histogram = self.series.setdefault(key, {'count': 0, 'sum': 0.0,
+                                                     'buckets': [0] * len(BUCKETS)})
+            histogram['count'] += 1
+            histogram['sum'] += value
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds spent in the block into the histogram name."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - start, **labels)
+
+    def state(self, name, state, **labels):
+        """Record that the thing identified by labels is now in state.
+
+        The seconds spent in each state are added to the counter name, with
+        the state as an extra label, whenever the state changes.
+        """
+        now = self.clock()
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            previous = self.states.get(key)
+            if previous and previous[0] == state:
+                return
+            self.states[key] = (state, now)
+        if previous:
+            self.inc(name, now - previous[1], state=previous[0], **labels)
+
+    def _collect(self):
+        # Account for the time spent so far in the current states
+        now = self.clock()
+        with self.lock:
+            series = dict(self.series)
+            types = dict(self.types)
+            for (name, labels), (state, since) in self.states.items():
+                types.setdefault(name, COUNTER)
+                key = (name, tuple(sorted(labels + (('state', state),))))
+                series[key] = series.get(key, 0) + now - since
+        return types, sorted(series.items())
+
+    def prometheus(self):
+        types, series = self._collect()
+        lines, typed = [], set()
+        for (name, labels), value in series:
+            if name not in typed:
+                lines.append('# TYPE {} {}'.format(name, types[name]))
+                typed.add(name)
+            if types[name] != HISTOGRAM:
+                lines.append('{}{} {}'.format(name, format_labels(labels), value))
+                continue
+            for bound, count in zip(BUCKETS, value['buckets']):
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(labels + (('le', str(bound)),)), count))
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(labels + (('le', '+Inf'),)), value['count']))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), value['sum']))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), value['count']))
+        return '\n'.join(lines) + '\n'
+
+    def json_lines(self):
+        types, series = self._collect()
+        now = self.clock()
+        lines = []
+        for (name, labels), value in series:
+            entry = {'name': name, 'type': types[name], 'labels': dict(labels), 'time': now}
+            if types[name] == HISTOGRAM:
+                entry.update(value, bounds=list(BUCKETS))
+            else:
+                entry['value'] = value
+            lines.append(json.dumps(entry, sort_keys=True))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """Write the metrics to path, as json lines if it ends in .json or .jsonl."""
+        data = self.json_lines() if path.endswith(('.json', '.jsonl')) else self.prometheus()
+        # Textfile collectors may read the file at any time, so it is replaced atomically
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.rename(tmp, path)
+        log.info('Metrics written to {}.'.format(path))
+
+    def export_at_exit(self, path):
+        atexit.register(self.export, path)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join('{}="{}"'.format(
+        k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels))
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
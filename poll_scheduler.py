@@ -0,0 +1,96 @@
+import random
+import logging as log
+from time import time, sleep
+
+# Defaults, in seconds
+MIN_INTERVAL = 10
+MAX_INTERVAL = 120
+BUSY_INTERVAL = 30
+DEADLINE = 3600
+
+BACKOFF_FACTOR = 2
+JITTER = 0.1
+
+
+class PollScheduler(object):
+    """Decides how long to wait between polls of a remote state.
+
+    Polling starts at min_interval and backs off exponentially (with jitter)
+    up to max_interval while the observed state stays the same. Any change
+    resets the interval to min_interval, and while the state is busy (e.g. a
+    build is running) the interval is capped at busy_interval so completion
+    is noticed quickly. Polling stops once the total deadline has passed.
+
+    When the time the state is expected to change is known (e.g. from past
+    build durations), polls wait for it, up to max_interval, then follow
+    closely, backing off as the change runs late.
+    """
+
+    def __init__(self, deadline=DEADLINE, max_interval=MAX_INTERVAL, min_interval=MIN_INTERVAL,
+                 busy_interval=BUSY_INTERVAL, factor=BACKOFF_FACTOR, jitter=JITTER,
+                 clock=time, sleeper=sleep):
+        self.max_interval = max(max_interval, 0)
+        self.min_interval = min(min_interval, self.max_interval)
+        self.busy_interval = min(max(busy_interval, self.min_interval), self.max_interval)
+        self.factor = factor
+        self.jitter = jitter
+        self.clock = clock
+        self.sleeper = sleeper
+
+        self.started = clock()
+        self.deadline = self.started + deadline
+        self.interval = self.min_interval
+        self.state = None
+        self.due = None
+        self.attempts = 0
+
+    def observe(self, state, busy=False, due=None):
+        """Record the latest observed state and adjust the next interval.
+
+        due is the time, as given by the clock, the state is expected to
+        change at, if known.
+        """
+        self.attempts += 1
+        self.due = due
+        if self.attempts > 1 and state == self.state:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        else:
+            self.interval = self.min_interval
+        if busy:
+            self.interval = min(self.interval, self.busy_interval)
+        self.state = state
+
+    def remaining(self):
+        return max(self.deadline - self.clock(), 0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def next_interval(self):
+        interval = self.interval
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.due is not None:
+            until = self.due - self.clock()
+            if until > 0:
+                interval = min(until, self.max_interval)
+            else:
+                # Poll within half the delay past the expected change
+                interval = min(interval, max(self.min_interval, -until / 2.0))
+        return min(interval, self.remaining())
+
+    def wait(self, wake=None):
+        """Sleep until the next poll is due.
+
+        If a threading.Event is passed as wake, setting it ends the wait
+        early. Returns True if the wait was cut short that way.
+        """
+        interval = self.next_interval()
+        log.debug('Next poll in {:.1f} seconds ({:.0f} seconds left before deadline).'
+                  .format(interval, self.remaining()))
+        if wake is not None:
+            woken = wake.wait(interval)
+            wake.clear()
+            return bool(woken)
+        self.sleeper(interval)
+        return False
@@ -0,0 +1,155 @@
+import re
+import hashlib
+import threading
+import logging as log
+from time import time, sleep
+
+from metrics import get_metrics
+
+# Requests kept in hand for interactive use of the same token
+RESERVE = 50
+# Requests that may be sent back to back before spacing applies
+BURST = 10
+# Pause used when a rate-limited response gives no hint of when to retry
+DEFAULT_PAUSE = 60
+# Share of the budget left below which usage is logged at INFO
+LOW_WATERMARK = 0.1
+
+
+def credential_key(headers=None, auth=None):
+    """Identify the credentials of a request without keeping the secret itself."""
+    secret = (headers or {}).get('Authorization') or (':'.join(auth) if auth else None)
+    if not secret:
+        return 'anonymous'
+    return hashlib.sha1(secret.encode('utf-8')).hexdigest()[:8]
+
+
+class Budget(object):
+    """Request budget of one set of credentials against one host."""
+
+    def __init__(self, host, key, clock):
+        self.host = host
+        self.key = key
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.blocked_until = 0
+        self.tokens = BURST
+        self.refilled = clock()
+        self.requests = 0
+        self.pauses = 0
+
+    def rate(self, now, reserve):
+        """Requests per second that fit the remaining budget until the reset, or None."""
+        if self.remaining is None or self.reset is None or self.reset <= now:
+            return None
+        # Small (e.g. unauthenticated) budgets keep a proportionally smaller reserve
+        reserve = min(reserve, (self.limit or 0) // 10)
+        return max(self.remaining - reserve, 0) / float(self.reset - now)
+
+    def as_dict(self):
+        return {'host': self.host, 'credentials': self.key, 'limit': self.limit,
+                'remaining': self.remaining, 'reset': self.reset,
+                'requests': self.requests, 'pauses': self.pauses}
+
+
+class RateLimiter(object):
+    """Token-bucket scheduler that spreads requests over each rate-limit window.
+
+    Budgets are tracked per host and per credentials from the X-RateLimit-*
+    (github) or RateLimit-* (docker) response headers. While the remaining
+    budget is known, requests are released at the rate that makes it last
+    until the reset, with a small burst allowance. Once only the reserve is
+    left, or a Retry-After is received, callers pause until it is lifted.
+    """
+
+    def __init__(self, reserve=RESERVE, clock=time, sleeper=sleep):
+        self.reserve = reserve
+        self.clock = clock
+        self.sleeper = sleeper
+        self.budgets = {}
+        self.lock = threading.Lock()
+
+    def budget(self, host, key):
+        with self.lock:
+            if (host, key) not in self.budgets:
+                self.budgets[(host, key)] = Budget(host, key, self.clock)
+            return self.budgets[(host, key)]
+
+    def acquire(self, host, key):
+        """Block until a request to host with the credentials fits the budget."""
+        budget = self.budget(host, key)
+        with self.lock:
+            now = self.clock()
+            wait = max(budget.blocked_until - now, 0)
+            rate = budget.rate(now, self.reserve)
+            if rate is not None:
+                if rate == 0:
+                    wait = max(wait, budget.reset - now)
+                else:
+                    budget.tokens = min(BURST, budget.tokens + (now - budget.refilled) * rate)
+                    budget.tokens -= 1
+                    if budget.tokens < 0:
+                        wait = max(wait, -budget.tokens / rate)
+            budget.refilled = now
+            budget.requests += 1
+            # Waits beyond the pacing of the bucket mean the budget ran out
+            paused = wait > 0 and (rate is None or rate == 0 or now < budget.blocked_until)
+            if paused:
+                budget.pauses += 1
+        if paused:
+            get_metrics().inc('rate_limit_pauses_total', host=host)
+            get_metrics().inc('rate_limit_paused_seconds_total', wait, host=host)
+            log.info('Pausing {:.0f} seconds to stay within the rate-limit of {} '
+                     '({} of {} requests left).'
+                     .format(wait, host, budget.remaining, budget.limit))
+        elif wait > 0:
+            log.debug('Spacing requests to {} by {:.1f} seconds.'.format(host, wait))
+        if wait > 0:
+            self.sleeper(wait)
+
+    def update(self, host, key, response):
+        """Record the budget reported by a response.
+
+        Returns True if the response was rejected by the rate-limit and the
+        request should be sent again after acquire().
+        """
+        budget = self.budget(host, key)
+        headers = response.headers
+        now = self.clock()
+        with self.lock:
+            limit = headers.get('X-RateLimit-Limit') or headers.get('RateLimit-Limit')
+            remaining = headers.get('X-RateLimit-Remaining') or headers.get('RateLimit-Remaining')
+            if limit is not None:
+                budget.limit = int(re.split('[;,]', limit)[0])
+            if remaining is not None:
+                budget.remaining = int(re.split('[;,]', remaining)[0])
+                if headers.get('X-RateLimit-Reset'):
+                    budget.reset = int(headers['X-RateLimit-Reset'])
+                else:
+                    window = re.search(r'w=(\d+)', remaining)
+                    if window and (budget.reset is None or budget.reset <= now):
+                        budget.reset = now + int(window.group(1))
+
+            limited = response.status_code == 429 or \
+                (response.status_code == 403 and budget.remaining == 0)
+            if limited:
+                retry_after = headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    budget.blocked_until = now + int(retry_after)
+                elif budget.remaining == 0 and budget.reset and budget.reset > now:
+                    budget.blocked_until = budget.reset
+                else:
+                    budget.blocked_until = now + DEFAULT_PAUSE
+
+        if budget.limit and budget.remaining is not None:
+            get_metrics().set('rate_limit_remaining', budget.remaining, host=host, credentials=key)
+            get_metrics().set('rate_limit_limit', budget.limit, host=host, credentials=key)
+            level = log.INFO if budget.remaining < budget.limit * LOW_WATERMARK else log.DEBUG
+            log.log(level, 'Rate-limit budget for {}: {} of {} requests left.'
+                    .format(host, budget.remaining, budget.limit))
+        return limited
+
+    def snapshot(self):
+        with self.lock:
+            return [b.as_dict() for b in self.budgets.values()]
@@ -0,0 +1,165 @@
+import re
+import json
+import hashlib
+import logging as log
+
+from http_client import get_client
+
+# Registries known by the name used in image references
+REGISTRY_URLS = {'docker.io': 'https://registry-1.docker.io'}
+
+# Every manifest format a tag may point at, so it is copied as is
+MANIFEST_TYPES = [
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v1+prettyjws'
+]
+LIST_TYPES = MANIFEST_TYPES[0], MANIFEST_TYPES[2]
+# Platform whose image is inspected when a tag points at a manifest list
+PLATFORM = {'os': 'linux', 'architecture': 'amd64'}
+
+
+def registry_url(registry):
+    if registry in REGISTRY_URLS:
+        return REGISTRY_URLS[registry]
+    return registry if re.match(r'^https?://', registry) else 'https://{}'.format(registry)
+
+
+def parse_challenge(header):
+    """Split a WWW-Authenticate header into its scheme and parameters."""
+    scheme, _, params = header.partition(' ')
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+class Registry(object):
+    """Minimal Registry v2 API client for reading and writing manifests.
+
+    Bearer tokens are fetched from the realm of the registry's challenge, once
+    per repository, with the actions given (e.g. 'pull' or 'pull,push').
+    Requests go through the shared http_client, so they are retried on
+    connection errors and 5xx responses and paced by its rate limiter.
+    """
+
+    def __init__(self, registry='docker.io', auth=None, actions='pull'):
+        self.url = registry_url(registry)
+        self.auth = auth
+        self.actions = actions
+        self.tokens = {}
+
+    def _authorize(self, name, challenge):
+        scheme, params = parse_challenge(challenge)
+        if scheme == 'basic':
+            if not self.auth:
+                raise RuntimeError('Registry {} requires credentials.'.format(self.url))
+            return None
+        if scheme != 'bearer' or 'realm' not in params:
+            raise RuntimeError('Unsupported registry authentication: {}'.format(challenge))
+
+        query = {'scope': 'repository:{}:{}'.format(name, self.actions)}
+        if 'service' in params:
+            query['service'] = params['service']
+        r = get_client().get(params['realm'], params=query, auth=self.auth)
+        if r.status_code != 200:
+            raise RuntimeError('Unable to authenticate to {} for {}, status code {}.'
+                               .format(self.url, name, r.status_code))
+        data = r.json()
+        return 'Bearer {}'.format(data.get('token') or data.get('access_token'))
+
+    def request(self, method, name, path, headers=None, **kwargs):
+        url = '{}/v2/{}/{}'.format(self.url, name, path)
+        headers = dict(headers or {})
+        for attempt in range(2):
+            if self.tokens.get(name):
+                headers['Authorization'] = self.tokens[name]
+            auth = self.auth if not self.tokens.get(name) else None
+            r = get_client().request(method, url, headers=headers, auth=auth, **kwargs)
+            # Tokens are short-lived, so a second 401 is only retried with a new one once
+            if r.status_code != 401 or attempt:
+                return r
+            self.tokens[name] = self._authorize(name, r.headers.get('WWW-Authenticate', ''))
+        return r
+
+    def manifest_digest(self, name, reference):
+        """The digest the reference points at, or None if it does not exist."""
+        r = self.request('HEAD', name, 'manifests/{}'.format(reference),
+                         headers={'Accept': ', '.join(MANIFEST_TYPES)})
+        if r.status_code == 404:
+            return None
+        if r.status_code != 200:
+            raise RuntimeError('Unable to read {}:{}, status code {}.'
+                               .format(name, reference, r.status_code))
+        return r.headers.get('Docker-Content-Digest')
+
+    def get_manifest(self, name, reference):
+        """Return the media type, raw body and digest of a manifest."""
+        r = self.request('GET', name, 'manifests/{}'.format(reference),
+                         headers={'Accept': ', '.join(MANIFEST_TYPES)})
+        if r.status_code == 404:
+            raise RuntimeError('Image {}:{} not found.'.format(name, reference))
+        if r.status_code != 200:
+            raise RuntimeError('Unable to read {}:{}, status code {}.'
+                               .format(name, reference, r.status_code))
+        body = r.content
+        digest = r.headers.get('Docker-Content-Digest') or \
+            'sha256:{}'.format(hashlib.sha256(body).hexdigest())
+        return r.headers.get('Content-Type'), body, digest
+
+    def put_manifest(self, name, reference, media_type, body):
+        r = self.request('PUT', name, 'manifests/{}'.format(reference),
+                         headers={'Content-Type': media_type}, data=body)
+        if r.status_code not in (200, 201):
+            raise RuntimeError('Unable to tag {}:{}, status code {}.'
+                               .format(name, reference, r.status_code))
+        return r.headers.get('Docker-Content-Digest')
+
+    def copy_tag(self, name, source, target):
+        """Point target at the manifest of source, returns True if the tag changed.
+
+        The manifest is uploaded unchanged, so no layers are transferred and
+        the target resolves to the same digest as the source.
+        """
+        media_type, body, digest = self.get_manifest(name, source)
+        if self.manifest_digest(name, target) == digest:
+            log.info('{}:{} already points at {}.'.format(name, target, digest))
+            return False
+        self.put_manifest(name, target, media_type, body)
+        log.info('Tagged {}:{} as {} ({}).'.format(name, source, target, digest))
+        return True
+
+    def get_blob(self, name, digest):
+        """Return a blob, checked against its sha256 digest."""
+        # Blobs are usually redirected to a CDN, which requests follows without our token
+        r = self.request('GET', name, 'blobs/{}'.format(digest))
+        if r.status_code != 200:
+            raise RuntimeError('Unable to read blob {} of {}, status code {}.'
+                               .format(digest, name, r.status_code))
+        if digest.startswith('sha256:') and \
+                hashlib.sha256(r.content).hexdigest() != digest.split(':', 1)[1]:
+            raise RuntimeError('Blob {} of {} does not match its digest.'.format(digest, name))
+        return r.content
+
+    def get_image_config(self, name, reference, platform=PLATFORM):
+        """Return the image config (labels, env, ...) of a reference.
+
+        Only the manifest and config blob are read, the config being a few
+        kilobytes whatever the size of the image.
+        """
+        media_type, body, _ = self.get_manifest(name, reference)
+        manifest = json.loads(body.decode('utf-8'))
+        if media_type in LIST_TYPES or 'manifests' in manifest:
+            matching = [m for m in manifest['manifests']
+                        if all(m.get('platform', {}).get(k) == v for k, v in platform.items())]
+            if not matching:
+                raise RuntimeError('{}:{} has no image for {}.'
+                                   .format(name, reference, '/'.join(platform.values())))
+            media_type, body, _ = self.get_manifest(name, matching[0]['digest'])
+            manifest = json.loads(body.decode('utf-8'))
+
+        if 'config' in manifest:
+            blob = json.loads(self.get_blob(name, manifest['config']['digest']).decode('utf-8'))
+        else:
+            # Schema 1 manifests carry the config in their history
+            blob = json.loads(manifest['history'][0]['v1Compatibility'])
+        return blob.get('config') or {}
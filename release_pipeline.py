@@ -0,0 +1,281 @@
+#!/usr/bin/python2
+from lazy_import import lazy_module
+from collections import OrderedDict
+from time import time
+import os
+import inspect
+import argparse
+import importlib
+import threading
+import subprocess
+import logging as log
+
+# Task states
+PENDING, RUNNING, SUCCEEDED, FAILED, SKIPPED = \
+    'PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', 'SKIPPED'
+
+# Number of tasks run concurrently
+WORKERS = 4
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+ruamel_yaml = lazy_module('ruamel.yaml')
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Run the tasks of a release pipeline file, '
+                                                 'running tasks that do not depend on each other '
+                                                 'concurrently.')
+
+    parser.add_argument('pipeline', metavar='PIPELINE', type=str,
+                        help='a yaml file listing the tasks of the release, see README.md.')
+
+    parser.add_argument('-w', dest='workers', type=int, default=WORKERS,
+                        help='the maximum number of tasks run at once (Default {}).'
+                        .format(WORKERS))
+
+    parser.add_argument('-o', dest='only', type=str, default=None, nargs='+',
+                        help='only run these tasks, and the tasks they depend on.')
+
+    parser.add_argument('-n', dest='dry_run', action='store_true',
+                        help='print the order the tasks would be run in, without running them.')
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+
+    return args.pipeline, args.workers, args.only, args.dry_run
+
+
+class Task(object):
+    def __init__(self, name, action, after=()):
+        self.name = name
+        self.action = action
+        self.after = list(after)
+        self.status = PENDING
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Pipeline(object):
+    """Dependency graph of release tasks.
+
+    Each task runs once all of the tasks it comes after have succeeded, at
+    most workers at a time, so the pipeline takes as long as its critical
+    path. When a task fails, the tasks that depend on it are skipped while
+    independent branches carry on.
+    """
+
+    def __init__(self):
+        self.tasks = OrderedDict()
+        self.started = None
+        self.finished = None
+
+    def add(self, name, action, after=()):
+        if name in self.tasks:
+            raise ValueError('Task {} is defined more than once.'.format(name))
+        self.tasks[name] = Task(name, action, after)
+        return self.tasks[name]
+
+    def levels(self):
+        """Group the tasks in the order they can run in, raising on bad dependencies."""
+        for task in self.tasks.values():
+            for dep in task.after:
+                if dep not in self.tasks:
+                    raise ValueError('Task {} comes after unknown task {}.'.format(task.name, dep))
+
+        done, levels = set(), []
+        while len(done) < len(self.tasks):
+            level = [name for name, task in self.tasks.items()
+                     if name not in done and all(dep in done for dep in task.after)]
+            if not level:
+                raise ValueError('The dependencies of tasks {} form a cycle.'
+                                 .format(', '.join(n for n in self.tasks if n not in done)))
+            levels.append(level)
+            done.update(level)
+        return levels
+
+    def select(self, names):
+        """Drop every task that is not one of names or one of their dependencies."""
+        keep, stack = set(), list(names)
+        while stack:
+            name = stack.pop()
+            if name not in self.tasks:
+                raise ValueError('Unknown task {}.'.format(name))
+            if name not in keep:
+                keep.add(name)
+                stack.extend(self.tasks[name].after)
+        for name in list(self.tasks):
+            if name not in keep:
+                del self.tasks[name]
+
+    def _skip_blocked(self):
+        changed = True
+        while changed:
+            changed = False
+            for task in self.tasks.values():
+                if task.status == PENDING and \
+                        any(self.tasks[dep].status in (FAILED, SKIPPED) for dep in task.after):
+                    log.warn('Skipping task {}, a task it depends on did not succeed.'
+                             .format(task.name))
+                    task.status = SKIPPED
+                    changed = True
+
+    def _execute(self, task, cond):
+        log.info('Starting task {}.'.format(task.name))
+        task.started = time()
+        try:
+            task.action()
+            task.status = SUCCEEDED
+            log.info('Task {} succeeded.'.format(task.name))
+        except (Exception, SystemExit) as e:
+            task.status = FAILED
+            task.error = e
+            log.error('Task {} failed: {}'.format(task.name, e))
+        task.finished = time()
+        with cond:
+            cond.notify()
+
+    def run(self, workers=WORKERS):
+        """Run every task, returns True if they all succeeded."""
+        self.levels()
+        self.started = time()
+        cond = threading.Condition()
+        with cond:
+            while True:
+                self._skip_blocked()
+                running = [t for t in self.tasks.values() if t.status == RUNNING]
+                ready = [t for t in self.tasks.values() if t.status == PENDING and
+                         all(self.tasks[dep].status == SUCCEEDED for dep in t.after)]
+                if not running and not ready:
+                    break
+                for task in ready[:max(workers - len(running), 0)]:
+                    task.status = RUNNING
+                    thread = threading.Thread(target=self._execute, args=(task, cond))
+                    thread.daemon = True
+                    thread.start()
+                cond.wait()
+        self.finished = time()
+        return all(t.status == SUCCEEDED for t in self.tasks.values())
+
+    def report(self):
+        lines = ['{:<40} {:<10} {:>9} {:>9}'.format('TASK', 'STATUS', 'START(s)', 'TIME(s)')]
+        for task in self.tasks.values():
+            start = '' if task.started is None else '{:.1f}'.format(task.started - self.started)
+            duration = '' if task.duration is None else '{:.1f}'.format(task.duration)
+            lines.append('{:<40} {:<10} {:>9} {:>9}'
+                         .format(task.name, task.status, start, duration))
+        total = sum(t.duration for t in self.tasks.values() if t.duration is not None)
+        lines.append('Wall time {:.1f}s for {:.1f}s of task time.'
+                     .format(self.finished - self.started, total))
+        return '\n'.join(lines)
+
+
+def command_action(name, command, env=None):
+    """Action running a shell command, its output is logged prefixed by the task name."""
+    def action():
+        process = subprocess.Popen(['/bin/bash', '-c', command], env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for line in iter(process.stdout.readline, b''):
+            log.info('[{}] {}'.format(name, line.decode('utf-8', 'replace').rstrip()))
+        if process.wait() != 0:
+            raise RuntimeError('Command exited with status {}.'.format(process.returncode))
+    return action
+
+
+def accepts(function, name):
+    """Whether function can be passed the keyword argument name."""
+    try:
+        spec = inspect.getfullargspec(function)
+        varkw = spec.varkw
+    except AttributeError:
+        spec = inspect.getargspec(function)
+        varkw = spec.keywords
+    return name in spec.args or varkw is not None
+
+
+def call_action(target, kwargs, repo=None, github=None):
+    """Action calling a function of the release scripts in this process.
+
+    target is module.function. If repo (owner/name) is given, the function is
+    also passed the PyGithub repo, built with the pipeline's github credentials,
+    and those credentials as auth unless args set it, e.g. for the streamed
+    uploads of git_release.create_release_from_file.
+    """
+    module_name, function_name = target.rsplit('.', 1)
+
+    def action():
+        function = getattr(importlib.import_module(module_name), function_name)
+        call_kwargs = dict(kwargs)
+        if repo:
+            from http_client import get_repo
+            owner, repo_name = repo.split('/')
+            call_kwargs['repo'] = get_repo(github['user'], repo_name, github['token'], owner)
+            if 'auth' not in call_kwargs and accepts(function, 'auth'):
+                call_kwargs['auth'] = (github['user'], github['token'])
+        function(**call_kwargs)
+    return action
+
+
+def expand(value):
+    # Substitute environment variables in the strings of a task definition
+    if isinstance(value, string_types):
+        return os.path.expandvars(value)
+    if isinstance(value, list):
+        return [expand(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, expand(v)) for k, v in value.items())
+    return value
+
+
+def load_pipeline(path):
+    yaml = ruamel_yaml.YAML(typ='safe')
+    with open(path, 'r') as f:
+        conf = yaml.load(f)
+
+    env = dict(os.environ)
+    env.update(dict((k, str(v)) for k, v in (conf.get('env') or {}).items()))
+    # Make the pipeline variables visible to in-process calls too
+    os.environ.update(env)
+    github = expand(conf.get('github'))
+
+    pipeline = Pipeline()
+    for task in conf['tasks']:
+        if 'call' in task:
+            action = call_action(task['call'], expand(task.get('args') or {}),
+                                 expand(task.get('repo')), github)
+        else:
+            action = command_action(task['name'], task['command'], env)
+        pipeline.add(task['name'], action, task.get('after', []))
+    return pipeline
+
+
+def main():
+    path, workers, only, dry_run = get_opts()
+    pipeline = load_pipeline(path)
+    if only:
+        pipeline.select(only)
+
+    if dry_run:
+        for i, level in enumerate(pipeline.levels()):
+            log.info('Step {}: {}'.format(i + 1, ', '.join(level)))
+        return
+
+    succeeded = pipeline.run(workers)
+    log.info('Pipeline report:\n{}'.format(pipeline.report()))
+    if not succeeded:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python2
+from lazy_import import lazy_module
+from registry import Registry
+from thread_pool import pool_map
+from time import sleep
+import os
+import argparse
+import getpass
+import logging as log
+
+ruamel_yaml = lazy_module('ruamel.yaml')
+
+IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images.yaml')
+WORKERS = 8
+RETRIES = 3
+# Seconds before the first retry of an image, doubled on each further attempt
+BACKOFF = 2
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Apply a new tag to existing images by copying '
+                                                 'their manifests in the registry, without '
+                                                 'pulling or pushing any layers.')
+
+    parser.add_argument('version', metavar='VERSION', type=str,
+                        help='the existing tag of the images (e.g. v0.3.1).')
+
+    parser.add_argument('tag', metavar='TAG', type=str,
+                        help='the tag to apply (e.g. stable).')
+
+    parser.add_argument('-i', dest='images', type=str, default=IMAGES,
+                        help='a yaml file with the registry and the list of images to tag '
+                             '(Default {}).'.format(IMAGES))
+
+    parser.add_argument('-u', dest='user', type=str, default=None,
+                        help='the registry user pushing the tag, prompts for the password '
+                             'unless [-a] is given.')
+
+    parser.add_argument('-a', dest='token', type=str, default=None,
+                        help='the password or access token of [-u].')
+
+    parser.add_argument('-w', dest='workers', type=int, default=WORKERS,
+                        help='the number of images tagged concurrently (Default {}).'
+                        .format(WORKERS))
+
+    parser.add_argument('-r', dest='retries', type=int, default=RETRIES,
+                        help='the number of times tagging an image is retried (Default {}).'
+                        .format(RETRIES))
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+    log.getLogger('requests').setLevel(log.WARNING)
+
+    if args.token and not args.user:
+        parser.error('[-a] requires a user to be specified via [-u].')
+
+    try:
+        registry, images = load_images(args.images)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+
+    auth = None
+    if args.user:
+        auth = (args.user, args.token if args.token else getpass.getpass())
+
+    return args.version, args.tag, registry, images, auth, args.workers, args.retries
+
+
+def load_images(path):
+    """Return the registry and the images listed in an images file, raises ValueError."""
+    with open(path, 'r') as f:
+        conf = ruamel_yaml.YAML(typ='safe').load(f)
+    if not isinstance(conf, dict) or not conf.get('images'):
+        raise ValueError('No images listed in {}.'.format(path))
+    return conf.get('registry', 'docker.io'), list(conf['images'])
+
+
+def retry(function, retries=RETRIES, backoff=BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except (RuntimeError, IOError) as e:
+            if attempt == retries:
+                raise
+            log.warn('{} Retrying in {} seconds.'.format(e, backoff * 2 ** attempt))
+            sleep(backoff * 2 ** attempt)
+
+
+def retag(registry, images, version, tag, workers=WORKERS, retries=RETRIES):
+    """Tag version of every image as tag concurrently, returns the error of each image or None."""
+    def copy(image):
+        try:
+            retry(lambda: registry.copy_tag(image, version, tag), retries)
+        except (RuntimeError, IOError) as e:
+            log.error('Failed to tag {}:{} as {}: {}'.format(image, version, tag, e))
+            return e
+        return None
+
+    return pool_map(copy, images, workers)
+
+
+def main():
+    version, tag, registry, images, auth, workers, retries = get_opts()
+
+    errors = retag(Registry(registry, auth, 'pull,push'), images, version, tag, workers, retries)
+    if any(errors):
+        log.error('Failed to tag {} of {} images.'.format(len([e for e in errors if e]),
+                                                          len(images)))
+        exit(1)
+    log.info('Images tagged successfully.')
+
+
+if __name__ == "__main__":
+    main()
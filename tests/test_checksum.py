@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import checksum  # noqa: E402
+
+
+class ChecksumTest(unittest.TestCase):
+    """checksum_files with and without a DigestCache."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='checksum-test-')
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        self.files = []
+        for i, size in enumerate((0, 10, 1 << 20)):
+            filename = os.path.join(self.tmpdir, 'asset-{}'.format(i))
+            with open(filename, 'wb') as f:
+                f.write(b'x' * size)
+            self.files.append(filename)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def expected(self):
+        digests = []
+        for filename in self.files:
+            with open(filename, 'rb') as f:
+                digests.append(hashlib.sha256(f.read()).hexdigest())
+        return digests
+
+    def test_digests_in_order(self):
+        self.assertEqual(checksum.checksum_files(self.files, workers=2), self.expected())
+
+    def test_saves_a_cache_with_a_relative_path(self):
+        cache = checksum.DigestCache('digests.json')
+        self.assertEqual(checksum.checksum_files(self.files, cache=cache), self.expected())
+
+        with open(os.path.join(self.tmpdir, 'digests.json')) as f:
+            self.assertEqual(sorted(json.load(f)), sorted(self.files))
+        self.assertEqual(checksum.DigestCache('digests.json').get(self.files[2]),
+                         self.expected()[2])
+
+    def test_cache_forgets_deleted_files(self):
+        path = os.path.join(self.tmpdir, 'cache', 'digests.json')
+        digests = checksum.checksum_files(self.files, cache=checksum.DigestCache(path))
+        os.remove(self.files[0])
+
+        cache = checksum.DigestCache(path)
+        cache.put(self.files[1], digests[1])
+        cache.save()
+        with open(path) as f:
+            self.assertEqual(sorted(json.load(f)), sorted(self.files[1:]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import http_cache  # noqa: E402
+import git_create_pr  # noqa: E402
+from stubs import GitHubStub  # noqa: E402
+
+SHA = 'a' * 40
+
+
+class GetStatusTest(unittest.TestCase):
+    """get_status merging the combined status and check runs of a github stand-in."""
+
+    def setUp(self):
+        self.stub = GitHubStub().start()
+        self.stub.add_pull(1, SHA, ['ci/status'], finish_after=0)
+        self.started = datetime.utcnow()
+        self.runs = []
+        self.stub.routes = [(method, pattern, self.get_check_runs
+                             if function == self.stub.get_check_runs else function)
+                            for method, pattern, function in self.stub.routes]
+        http_cache.configure()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def get_check_runs(self, match, query, data):
+        return 200, {}, {'total_count': len(self.runs), 'check_runs': self.runs}
+
+    def check_run(self, run_id, status, conclusion=None, started=True):
+        at = (self.started + timedelta(seconds=run_id)).strftime(git_create_pr.DATE_FORMAT)
+        return {'id': run_id, 'name': 'ci/run-{}'.format(run_id), 'status': status,
+                'conclusion': conclusion, 'started_at': at if started else None,
+                'completed_at': at if conclusion else None}
+
+    def get_status(self):
+        return git_create_pr.get_status('{}/repos/owner/repo/commits/{}'.format(
+            self.stub.url, SHA), self.started - timedelta(minutes=1), 'token')
+
+    def test_skips_check_runs_not_started(self):
+        self.runs = [self.check_run(1, 'completed', 'success'), self.check_run(2, 'in_progress'),
+                     self.check_run(3, 'queued', started=False)]
+        states = dict((s['context'], s['state']) for s in self.get_status())
+        self.assertEqual(states, {'ci/status': 'success', 'ci/run-1': 'success',
+                                  'ci/run-2': 'pending'})
+
+
+if __name__ == '__main__':
+    unittest.main()
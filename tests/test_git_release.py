@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import checksum  # noqa: E402
+import git_release  # noqa: E402
+from lazy_import import lazy_module  # noqa: E402
+from stubs import GitHubStub  # noqa: E402
+
+github = lazy_module('github')
+
+TAG = 'v1'
+
+
+class ResumeReleaseTest(unittest.TestCase):
+    """create_release resuming an interrupted upload against a github stand-in."""
+
+    def setUp(self):
+        self.stub = GitHubStub().start()
+        self.tmpdir = tempfile.mkdtemp(prefix='git-release-test-')
+        checksum.configure(os.path.join(self.tmpdir, 'sha256.json'))
+        self.manifest = os.path.join(self.tmpdir, 'release.yaml.manifest.json')
+        self.repo = github.Github('user', 'token', base_url=self.stub.url) \
+            .get_repo('owner/repo')
+        self.assets = []
+        for i in range(4):
+            name = os.path.join(self.tmpdir, 'asset-{}.tar.gz'.format(i))
+            with open(name, 'wb') as f:
+                f.write(os.urandom(1024))
+            self.assets.append({'name': name, 'label': os.path.basename(name),
+                                'Content-Type': 'application/gzip'})
+
+        # Uploads of the failing asset are rejected until it is cleared
+        self.failing = None
+        self.uploaded = []
+        upload = self.stub.upload
+
+        def failing_upload(match, query, data):
+            if query['name'][0] == self.failing:
+                return 502, {}, {'message': 'Server Error'}
+            self.uploaded.append(query['name'][0])
+            return upload(match, query, data)
+        self.stub.routes = [(method, pattern, failing_upload if function == upload else function)
+                            for method, pattern, function in self.stub.routes]
+
+    def tearDown(self):
+        self.stub.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def create_release(self, resume):
+        git_release.create_release(self.repo, TAG, TAG, 'body', False, False, 'master',
+                                   self.assets, tmpdir=None, auth=('user', 'token'), workers=2,
+                                   resume=resume, manifest=self.manifest)
+
+    def remote_names(self):
+        release = self.stub.releases[TAG]
+        return sorted(asset['name'] for asset in self.stub.assets[release['id']])
+
+    def test_resume_uploads_only_missing_and_changed_assets(self):
+        names = [os.path.basename(asset['name']) for asset in self.assets]
+        self.failing = names[2]
+        self.assertRaises(IOError, self.create_release, True)
+        self.assertEqual(self.remote_names(), sorted(names[:2] + names[3:]))
+        with open(self.manifest) as f:
+            self.assertEqual(sorted(json.load(f)['assets']), sorted(names[:2] + names[3:]))
+
+        # The first asset changed since its upload
+        with open(self.assets[0]['name'], 'wb') as f:
+            f.write(os.urandom(1024))
+        os.utime(self.assets[0]['name'], (0, 0))
+        self.failing, self.uploaded = None, []
+        self.create_release(True)
+
+        self.assertEqual(sorted(self.uploaded),
+                         sorted([names[0], names[2], git_release.CHECKSUM_FILENAME]))
+        self.assertEqual(self.remote_names(), sorted(names + [git_release.CHECKSUM_FILENAME]))
+        self.assertEqual(len(self.stub.releases), 1)
+
+        checksums = checksum.checksum_files([asset['name'] for asset in self.assets])
+        with open(self.manifest) as f:
+            recorded = json.load(f)['assets']
+        self.assertEqual([recorded[name]['sha256'] for name in names], checksums)
+
+if __name__ == '__main__':
+    unittest.main()
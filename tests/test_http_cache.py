@@ -0,0 +1,90 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import http_cache  # noqa: E402
+from thread_pool import pool_map  # noqa: E402
+from stubs import Stub  # noqa: E402
+
+LAST_MODIFIED = 'Thu, 15 Oct 2026 10:00:00 GMT'
+
+
+class StatusStub(Stub):
+    """Serves a json status with validators, recording the headers of each request."""
+
+    def __init__(self, **kwargs):
+        super(StatusStub, self).__init__(**kwargs)
+        self.body = {'state': 'pending'}
+        self.sent = []
+        self.route('GET', '/status', self.get_status)
+
+    def authorize(self, method, path, headers):
+        with self.lock:
+            self.sent.append(dict(headers))
+        return None
+
+    def get_status(self, match, query, data):
+        return 200, {'Last-Modified': LAST_MODIFIED}, self.body
+
+
+class ConditionalGetTest(unittest.TestCase):
+    """conditional_get revalidating against a stand-in with ETags."""
+
+    def setUp(self):
+        self.stub = StatusStub().start()
+        self.url = '{}/status'.format(self.stub.url)
+        self.cache = http_cache.ResponseCache()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_not_modified_is_answered_from_the_cache(self):
+        first = http_cache.conditional_get(self.url, cache=self.cache)
+        second = http_cache.conditional_get(self.url, cache=self.cache)
+
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual((second.status_code, second.json()), (200, {'state': 'pending'}))
+        self.assertNotIn('If-None-Match', self.stub.sent[0])
+        self.assertEqual(self.stub.sent[1].get('If-None-Match'), first.headers['ETag'])
+        self.assertEqual(self.stub.sent[1].get('If-Modified-Since'), LAST_MODIFIED)
+        self.assertEqual((self.cache.hits, self.cache.misses, self.stub.not_modified), (1, 1, 1))
+
+    def test_changes_are_fetched(self):
+        http_cache.conditional_get(self.url, cache=self.cache)
+        self.stub.body = {'state': 'success'}
+        r = http_cache.conditional_get(self.url, cache=self.cache)
+
+        self.assertFalse(r.from_cache)
+        self.assertEqual(r.json(), {'state': 'success'})
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_credentials_are_cached_apart(self):
+        http_cache.conditional_get(self.url, cache=self.cache)
+        http_cache.conditional_get(self.url, headers={'Authorization': 'token a'},
+                                   cache=self.cache)
+        self.assertNotIn('If-None-Match', self.stub.sent[1])
+
+    def test_persisted_validators_are_shared(self):
+        path = tempfile.mkdtemp(prefix='http-cache-test-')
+        try:
+            http_cache.conditional_get(self.url, cache=http_cache.ResponseCache(path=path))
+            r = http_cache.conditional_get(self.url, cache=http_cache.ResponseCache(path=path))
+        finally:
+            shutil.rmtree(path)
+        self.assertTrue(r.from_cache)
+
+    def test_counts_the_requests_of_every_thread(self):
+        http_cache.conditional_get(self.url, cache=self.cache)
+        pool_map(lambda i: http_cache.conditional_get(self.url, cache=self.cache), range(200), 8)
+        self.assertEqual((self.cache.hits, self.cache.misses), (200, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
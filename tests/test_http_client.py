@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import http_client  # noqa: E402
+from lazy_import import lazy_module  # noqa: E402
+from stubs import GitHubStub  # noqa: E402
+
+github = lazy_module('github')
+
+
+class GithubRoutingTest(unittest.TestCase):
+    """PyGithub's requests go through the shared client and its rate limiter."""
+
+    def setUp(self):
+        self.stub = GitHubStub().start()
+        get_repo = self.stub.get_repo
+
+        def limited_get_repo(match, query, data):
+            status, headers, body = get_repo(match, query, data)
+            return status, {'X-RateLimit-Limit': '5000', 'X-RateLimit-Remaining': '4321',
+                            'X-RateLimit-Reset': '4102444800'}, body
+        self.stub.routes[0] = ('GET', self.stub.routes[0][1], limited_get_repo)
+        self.limiter = http_client.RateLimiter()
+        http_client.configure(limiter=self.limiter)
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_pygithub_requests_update_the_budget(self):
+        http_client.route_github()
+        repo = github.Github('user', 'token', base_url=self.stub.url).get_repo('owner/repo')
+
+        self.assertEqual(repo.full_name, 'owner/repo')
+        budgets = self.limiter.snapshot()
+        self.assertEqual(len(budgets), 1)
+        self.assertEqual(budgets[0]['host'], self.stub.url.split('://')[1])
+        self.assertEqual((budgets[0]['remaining'], budgets[0]['limit']), (4321, 5000))
+        self.assertEqual(budgets[0]['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from poll_scheduler import PollScheduler  # noqa: E402
+
+
+class Clock(object):
+    """Clock whose sleeps only move it forward, recording their lengths."""
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class PollSchedulerTest(unittest.TestCase):
+    """PollScheduler intervals without jitter, against a fake clock."""
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def scheduler(self, deadline=3600, **kwargs):
+        kwargs = dict({'min_interval': 10, 'max_interval': 60, 'busy_interval': 20,
+                       'jitter': 0}, **kwargs)
+        return PollScheduler(deadline, clock=self.clock, sleeper=self.clock.sleep, **kwargs)
+
+    def poll(self, schedule, states, busy=False):
+        for state in states:
+            schedule.observe(state, busy)
+            schedule.wait()
+        return self.clock.sleeps
+
+    def test_backs_off_up_to_the_cap(self):
+        self.assertEqual(self.poll(self.scheduler(), ['a'] * 6), [10, 20, 40, 60, 60, 60])
+
+    def test_changes_reset_the_interval(self):
+        self.assertEqual(self.poll(self.scheduler(), ['a', 'a', 'a', 'b', 'b']),
+                         [10, 20, 40, 10, 20])
+
+    def test_busy_states_are_polled_closely(self):
+        self.assertEqual(self.poll(self.scheduler(), ['a'] * 4, busy=True), [10, 20, 20, 20])
+
+    def test_jitter_stays_within_bounds(self):
+        schedule = self.scheduler(jitter=0.1)
+        for _ in range(50):
+            schedule.observe('a')
+            self.assertTrue(schedule.interval * 0.9 <= schedule.next_interval() <=
+                            schedule.interval * 1.1)
+
+    def test_waits_for_the_expected_change_then_follows_it(self):
+        schedule = self.scheduler()
+        schedule.observe('a', due=self.clock() + 45)
+        self.assertEqual(schedule.next_interval(), 45)
+        schedule.observe('a', due=self.clock() + 600)
+        self.assertEqual(schedule.next_interval(), 60)
+        # Running 30 seconds late, polled within half the delay
+        schedule.observe('a', due=self.clock() - 30)
+        self.assertEqual(schedule.next_interval(), 15)
+
+    def test_stops_at_the_deadline(self):
+        schedule = self.scheduler(deadline=100)
+        polls = 0
+        while not schedule.expired():
+            polls += 1
+            schedule.observe('a')
+            schedule.wait()
+        self.assertEqual(self.clock.sleeps, [10, 20, 40, 30])
+        self.assertEqual((polls, schedule.attempts, schedule.remaining()), (4, 4, 0))
+
+    def test_events_end_the_wait_early(self):
+        schedule = self.scheduler(min_interval=30)
+        schedule.observe('a')
+        wake = threading.Event()
+        wake.set()
+        self.assertTrue(schedule.wait(wake))
+        self.assertFalse(wake.is_set())
+        self.assertEqual(self.clock.sleeps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
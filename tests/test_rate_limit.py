@@ -0,0 +1,109 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limit  # noqa: E402
+from rate_limit import RateLimiter  # noqa: E402
+
+HOST, KEY = 'api.github.com', 'key'
+
+
+class Clock(object):
+    """Clock whose sleeps only move it forward, recording their lengths."""
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response(object):
+    def __init__(self, status_code=200, **headers):
+        self.status_code = status_code
+        self.headers = dict((k.replace('_', '-'), str(v)) for k, v in headers.items())
+
+
+class RateLimiterTest(unittest.TestCase):
+    """RateLimiter budgets driven by response headers and a fake clock."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = RateLimiter(clock=self.clock, sleeper=self.clock.sleep)
+
+    def github_response(self, remaining, reset_in, status_code=200, limit=5000):
+        return Response(status_code, X_RateLimit_Limit=limit, X_RateLimit_Remaining=remaining,
+                        X_RateLimit_Reset=int(self.clock() + reset_in))
+
+    def test_unknown_budgets_are_not_paced(self):
+        for _ in range(100):
+            self.limiter.acquire(HOST, KEY)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_paces_requests_to_last_until_the_reset(self):
+        # 1000 requests beyond the reserve for 1000 seconds, one per second
+        self.limiter.update(HOST, KEY, self.github_response(1000 + rate_limit.RESERVE, 1000))
+        for _ in range(rate_limit.BURST + 5):
+            self.limiter.acquire(HOST, KEY)
+
+        self.assertEqual(len(self.clock.sleeps), 5)
+        for seconds in self.clock.sleeps:
+            self.assertAlmostEqual(seconds, 1.0, places=2)
+        self.assertEqual(self.limiter.snapshot()[0]['pauses'], 0)
+
+    def test_small_budgets_keep_a_smaller_reserve(self):
+        self.limiter.update(HOST, KEY, self.github_response(30, 60, limit=60))
+        self.assertAlmostEqual(self.limiter.budget(HOST, KEY).rate(self.clock(), 50), 0.4)
+
+    def test_pauses_until_the_reset_of_an_exhausted_budget(self):
+        self.assertTrue(self.limiter.update(HOST, KEY, self.github_response(0, 300, 403)))
+        self.limiter.acquire(HOST, KEY)
+
+        self.assertEqual(self.clock.sleeps, [300])
+        self.assertEqual(self.limiter.snapshot()[0]['pauses'], 1)
+
+    def test_pauses_while_only_the_reserve_is_left(self):
+        self.assertFalse(self.limiter.update(HOST, KEY, self.github_response(20, 120)))
+        self.limiter.acquire(HOST, KEY)
+        self.assertEqual(self.clock.sleeps, [120])
+
+    def test_pauses_for_retry_after(self):
+        self.assertTrue(self.limiter.update(HOST, KEY, Response(429, Retry_After=30)))
+        self.limiter.acquire(HOST, KEY)
+        self.limiter.acquire(HOST, KEY)
+        self.assertEqual(self.clock.sleeps, [30])
+
+    def test_pauses_by_default_without_a_hint(self):
+        self.assertTrue(self.limiter.update(HOST, KEY, Response(429)))
+        self.limiter.acquire(HOST, KEY)
+        self.assertEqual(self.clock.sleeps, [rate_limit.DEFAULT_PAUSE])
+
+    def test_forbidden_responses_with_budget_left_are_not_limited(self):
+        self.assertFalse(self.limiter.update(HOST, KEY, self.github_response(4000, 300, 403)))
+
+    def test_docker_windows(self):
+        self.limiter.update('registry-1.docker.io', KEY,
+                            Response(RateLimit_Limit='100;w=21600',
+                                     RateLimit_Remaining='76;w=21600'))
+        budget = self.limiter.budget('registry-1.docker.io', KEY)
+        self.assertEqual((budget.limit, budget.remaining, budget.reset),
+                         (100, 76, self.clock() + 21600))
+
+    def test_budgets_are_kept_per_host_and_credentials(self):
+        self.limiter.update(HOST, KEY, self.github_response(0, 300, 403))
+        self.limiter.acquire(HOST, 'other')
+        self.limiter.acquire('hub.docker.com', KEY)
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertNotEqual(rate_limit.credential_key({'Authorization': 'token a'}),
+                            rate_limit.credential_key(auth=('user', 'a')))
+
+
+if __name__ == '__main__':
+    unittest.main()
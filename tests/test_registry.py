@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import retag  # noqa: E402
+from registry import Registry  # noqa: E402
+from stubs import RegistryStub  # noqa: E402
+
+CONFIG = {'Labels': {'version': '0.3.1'}, 'Env': ['SPARK_VERSION=2.3.0', 'PATH=/usr/bin']}
+
+
+class RegistryTest(unittest.TestCase):
+    """Registry and retag against a Registry v2 stand-in."""
+
+    def setUp(self):
+        self.stub = RegistryStub().start()
+        self.registry = Registry(self.stub.url, actions='pull,push')
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_requests_a_token_once_per_repository(self):
+        digest = self.stub.add_image('owner/image', 'v0.3.1', CONFIG)
+        self.stub.add_image('owner/other', 'v0.3.1', CONFIG)
+
+        for _ in range(2):
+            self.assertEqual(self.registry.manifest_digest('owner/image', 'v0.3.1'), digest)
+        self.assertEqual(self.stub.token_requests, 1)
+        self.registry.manifest_digest('owner/other', 'v0.3.1')
+        self.assertEqual(self.stub.token_requests, 2)
+
+    def test_missing_manifest_has_no_digest(self):
+        self.assertIsNone(self.registry.manifest_digest('owner/image', 'v9'))
+        self.assertRaises(RuntimeError, self.registry.get_manifest, 'owner/image', 'v9')
+
+    def test_copy_tag_uploads_the_manifest_once(self):
+        digest = self.stub.add_image('owner/image', 'v0.3.1', CONFIG)
+
+        self.assertTrue(self.registry.copy_tag('owner/image', 'v0.3.1', 'stable'))
+        self.assertEqual(self.registry.manifest_digest('owner/image', 'stable'), digest)
+        self.assertFalse(self.registry.copy_tag('owner/image', 'v0.3.1', 'stable'))
+        self.assertEqual(self.stub.puts, 1)
+
+    def test_pull_only_tokens_can_not_tag(self):
+        self.stub.add_image('owner/image', 'v0.3.1', CONFIG)
+        registry = Registry(self.stub.url, actions='pull')
+        self.assertRaises(RuntimeError, registry.copy_tag, 'owner/image', 'v0.3.1', 'stable')
+
+    def test_image_config_of_a_manifest_list(self):
+        self.stub.add_image('owner/image', 'v0.3.1', None,
+                            platforms={'amd64': CONFIG, 'arm64': {'Labels': {'arch': 'arm'}}})
+
+        self.assertEqual(self.registry.get_image_config('owner/image', 'v0.3.1'), CONFIG)
+        self.assertRaises(RuntimeError, self.registry.get_image_config, 'owner/image', 'v0.3.1',
+                          {'os': 'windows', 'architecture': 'amd64'})
+
+    def test_retag(self):
+        digests = [self.stub.add_image(image, 'v0.3.1', CONFIG) for image in ('a/one', 'a/two')]
+
+        errors = retag.retag(self.registry, ['a/one', 'a/two', 'a/missing'], 'v0.3.1', 'stable',
+                             retries=0)
+        self.assertEqual(errors[:2], [None, None])
+        self.assertIsInstance(errors[2], RuntimeError)
+        self.assertEqual([self.registry.manifest_digest(image, 'stable')
+                          for image in ('a/one', 'a/two')], digests)
+
+
+if __name__ == '__main__':
+    unittest.main()
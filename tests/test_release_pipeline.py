@@ -0,0 +1,114 @@
+import os
+import sys
+import types
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+import release_pipeline  # noqa: E402
+from release_pipeline import Pipeline, call_action  # noqa: E402
+from release_pipeline import SUCCEEDED, FAILED, SKIPPED  # noqa: E402
+
+TARGETS = 'pipeline_test_targets'
+
+
+class PipelineTest(unittest.TestCase):
+    """Pipelines of in-process call_actions of a stand-in module."""
+
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        targets = types.ModuleType(TARGETS)
+
+        def step(name, fail=False):
+            with self.lock:
+                self.calls.append(name)
+            if fail:
+                raise RuntimeError('{} failed'.format(name))
+
+        def release(repo, conf, **kwargs):
+            self.calls.append((repo, conf, kwargs.get('auth')))
+
+        targets.step, targets.release = step, release
+        sys.modules[TARGETS] = targets
+
+    def tearDown(self):
+        del sys.modules[TARGETS]
+
+    def pipeline(self, tasks):
+        pipeline = Pipeline()
+        for name, after, fail in tasks:
+            pipeline.add(name, call_action(TARGETS + '.step', {'name': name, 'fail': fail}),
+                         after)
+        return pipeline
+
+    def statuses(self, pipeline):
+        return dict((name, task.status) for name, task in pipeline.tasks.items())
+
+    def test_failure_skips_its_dependents_only(self):
+        pipeline = self.pipeline([('tag', [], True), ('watch', ['tag'], False),
+                                  ('verify', ['watch'], False), ('docs', [], False),
+                                  ('publish', ['docs'], False)])
+
+        self.assertFalse(pipeline.run(workers=2))
+        self.assertEqual(self.statuses(pipeline),
+                         {'tag': FAILED, 'watch': SKIPPED, 'verify': SKIPPED,
+                          'docs': SUCCEEDED, 'publish': SUCCEEDED})
+        self.assertEqual(sorted(self.calls), ['docs', 'publish', 'tag'])
+        self.assertIsInstance(pipeline.tasks['tag'].error, RuntimeError)
+        self.assertIn('Wall time', pipeline.report())
+
+    def test_runs_tasks_after_their_dependencies(self):
+        pipeline = self.pipeline([('c', ['a', 'b'], False), ('a', [], False),
+                                  ('b', ['a'], False)])
+
+        self.assertEqual(pipeline.levels(), [['a'], ['b'], ['c']])
+        self.assertTrue(pipeline.run())
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+
+    def test_rejects_cycles(self):
+        pipeline = self.pipeline([('a', [], False), ('b', ['a', 'd'], False),
+                                  ('c', ['b'], False), ('d', ['c'], False)])
+
+        self.assertRaises(ValueError, pipeline.levels)
+        self.assertRaises(ValueError, pipeline.run)
+        self.assertEqual(self.calls, [])
+
+    def test_rejects_unknown_dependencies(self):
+        pipeline = self.pipeline([('a', [], False), ('b', ['missing'], False)])
+
+        self.assertRaises(ValueError, pipeline.run)
+        self.assertEqual(self.calls, [])
+
+    def test_selects_tasks_and_their_dependencies(self):
+        pipeline = self.pipeline([('a', [], False), ('b', ['a'], False), ('c', ['b'], False),
+                                  ('other', [], False)])
+        pipeline.select(['b'])
+
+        self.assertEqual(list(pipeline.tasks), ['a', 'b'])
+        self.assertTrue(pipeline.run())
+        self.assertEqual(self.calls, ['a', 'b'])
+        self.assertRaises(ValueError, pipeline.select, ['c'])
+
+    def test_passes_the_github_credentials(self):
+        get_repo = http_client.get_repo
+        http_client.get_repo = lambda user, name, token, owner: '{}/{}'.format(owner, name)
+        try:
+            github = {'user': 'user', 'token': 'token'}
+            call_action(TARGETS + '.release', {'conf': 'release.yaml'}, 'owner/repo', github)()
+            call_action(TARGETS + '.release', {'conf': 'release.yaml', 'auth': None},
+                        'owner/repo', github)()
+        finally:
+            http_client.get_repo = get_repo
+        self.assertEqual(self.calls, [('owner/repo', 'release.yaml', ('user', 'token')),
+                                      ('owner/repo', 'release.yaml', None)])
+
+    def test_steps_do_not_take_credentials(self):
+        self.assertFalse(release_pipeline.accepts(sys.modules[TARGETS].step, 'auth'))
+        self.assertTrue(release_pipeline.accepts(sys.modules[TARGETS].release, 'auth'))
+
+
+if __name__ == '__main__':
+    unittest.main()
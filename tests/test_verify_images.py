@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import verify_images  # noqa: E402
+from registry import Registry  # noqa: E402
+from stubs import RegistryStub  # noqa: E402
+
+CONFIG = {'Labels': {'version': '0.3.1'}, 'Env': ['SPARK_VERSION=2.3.0', 'PATH=/usr/bin']}
+
+
+class VerifyImagesTest(unittest.TestCase):
+    """verify_images against a Registry v2 stand-in."""
+
+    def setUp(self):
+        self.stub = RegistryStub().start()
+        self.registry = Registry(self.stub.url)
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_verify_images(self):
+        self.stub.add_image('a/one', 'v0.3.1', CONFIG)
+        self.stub.add_image('a/one', 'stable', CONFIG)
+        self.stub.add_image('a/two', 'v0.3.1', {'Labels': {'version': '0.3.10'}})
+        self.stub.add_image('a/two', 'stable', {'Labels': {'version': '0.3.0'}})
+
+        problems = verify_images.verify_images(self.registry, ['a/one', 'a/two'], 'v0.3.1',
+                                               same_as='stable',
+                                               expect=[('SPARK_VERSION', '2.3')])
+        self.assertEqual(problems[0], [])
+        self.assertEqual(len(problems[1]), 3)
+
+    def test_reports_version(self):
+        for value, expected in (('0.3.1', True), ('v0.3.1', True), ('release-v0.3.1-2', True),
+                                ('0.3.10', False), ('10.3.1', False), ('0.3.1.4', False)):
+            self.assertEqual(verify_images.reports_version({'version': value}, 'v0.3.1'),
+                             expected, value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import unittest
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import http_cache  # noqa: E402
+import watch_builds  # noqa: E402
+from stubs import DockerHubStub  # noqa: E402
+
+
+class WatchBuildTest(unittest.TestCase):
+    """watch_build against a Docker Hub stand-in whose builds finish after a few polls."""
+
+    def setUp(self):
+        self.stub = DockerHubStub().start()
+        self.endpoints = watch_builds.V2_ENDPOINT, watch_builds.REGISTRY_ENDPOINT
+        watch_builds.V2_ENDPOINT = '{}/v2'.format(self.stub.url)
+        watch_builds.REGISTRY_ENDPOINT = self.stub.url
+        http_cache.configure()
+
+    def tearDown(self):
+        watch_builds.V2_ENDPOINT, watch_builds.REGISTRY_ENDPOINT = self.endpoints
+        self.stub.stop()
+
+    def test_takes_plain_tags_and_branches(self):
+        self.stub.add_repo('owner/repo', ['v1', 'master-latest'], finish_after=2)
+        watch_builds.watch_build('owner/repo', 'token', 0.05, 30, tags=['v1'],
+                                 branches=['master'])
+        self.assertGreater(self.stub.counters()['requests'], 2)
+
+    def test_fails_when_builds_do_not_finish(self):
+        self.stub.add_repo('owner/repo', ['v1'], finish_after=1000)
+        self.assertRaises(RuntimeError, watch_builds.watch_build, 'owner/repo', 'token', 0.05,
+                          0.3, tags=['v1'])
+
+    def test_forced_triggers_are_confirmed_within_the_deadline(self):
+        # The stand-in accepts triggers without starting builds
+        self.stub.add_repo('owner/repo', ['v1'], finish_after=0)
+        start = time()
+        self.assertRaises(RuntimeError, watch_builds.watch_build, 'owner/repo', 'token', 0.05, 1,
+                          force=True, tags=['v1'])
+        self.assertLess(time() - start, 5)
+
+
+class BuildHistoryTest(unittest.TestCase):
+    """Incremental fetches of a Docker Hub stand-in's build history."""
+
+    def setUp(self):
+        self.stub = DockerHubStub().start()
+        self.endpoint = watch_builds.V2_ENDPOINT
+        watch_builds.V2_ENDPOINT = '{}/v2'.format(self.stub.url)
+        http_cache.configure()
+
+    def tearDown(self):
+        watch_builds.V2_ENDPOINT = self.endpoint
+        self.stub.stop()
+
+    def polls(self, history, count):
+        requests = []
+        for _ in range(count):
+            before = self.stub.counters()['requests']
+            builds = history.fetch()
+            requests.append(self.stub.counters()['requests'] - before)
+        return builds, requests
+
+    def test_polls_a_deep_tag_in_one_request(self):
+        # The newest build of the last tag is 150 builds deep
+        names = ['t{}'.format(i) for i in range(7)]
+        self.stub.add_repo('owner/repo', names, history=200)
+        tags = [{'docker_tag': name, 'source_type': 'Tag', 'sourceref': name}
+                for name in names]
+        history = watch_builds.BuildHistory('owner', 'repo', tags)
+
+        builds, requests = self.polls(history, 4)
+        self.assertEqual(requests, [1] * 4)
+        self.assertEqual(sorted(b['dockertag_name'] for b in builds), names)
+
+        # Rebuilds of every tag move the floor up to the new builds
+        repo = self.stub.repos['owner/repo']
+        for i, name in enumerate(names):
+            repo['builds'].insert(0, {'id': 201 + i, 'build_code': 'new-{}'.format(i),
+                                      'dockertag_name': name, 'status': watch_builds.SUCCESS,
+                                      'watched': True})
+        builds, requests = self.polls(history, 3)
+        self.assertEqual(requests, [1] * 3)
+        self.assertEqual(history.floor_id, 201)
+        self.assertEqual(sorted(b['build_code'] for b in builds),
+                         ['new-{}'.format(i) for i in range(7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import unittest
+import threading
+from time import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import http_cache  # noqa: E402
+import git_create_pr  # noqa: E402
+import webhook  # noqa: E402
+from http_client import get_client  # noqa: E402
+from stubs import GitHubStub  # noqa: E402
+
+SECRET = 'secret'
+SHA = 'a' * 40
+
+
+def status_payload(sha=SHA, context='ci/test', state='success', at=None):
+    at = at or datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
+    return {'id': 7, 'sha': sha, 'context': context, 'state': state, 'created_at': at,
+            'updated_at': at}
+
+
+class WebhookReceiverTest(unittest.TestCase):
+    """WebhookReceiver against a local sender of signed payloads."""
+
+    def setUp(self):
+        self.receiver = webhook.WebhookReceiver(0, SECRET, SHA, git_create_pr.check_run_state,
+                                                host='127.0.0.1').start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.receiver.port)
+
+    def tearDown(self):
+        self.receiver.stop()
+
+    def send(self, event, payload, signature=True):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        headers = {'X-GitHub-Event': event, 'Content-Type': 'application/json'}
+        if signature is True:
+            headers['X-Hub-Signature-256'] = webhook.sign(SECRET, body)
+        elif signature:
+            headers['X-Hub-Signature-256'] = signature
+        return get_client().post(self.url, data=body, headers=headers).status_code
+
+    def test_queues_signed_statuses(self):
+        self.assertEqual(self.send('status', status_payload()), 204)
+        self.assertTrue(self.receiver.event.is_set())
+        statuses = self.receiver.drain()
+        self.assertEqual([(s['context'], s['state']) for s in statuses], [('ci/test', 'success')])
+        self.assertEqual(self.receiver.drain(), [])
+
+    def test_accepts_sha1_signatures(self):
+        body = json.dumps(status_payload()).encode('utf-8')
+        headers = {'X-GitHub-Event': 'status',
+                   'X-Hub-Signature': webhook.sign(SECRET, body, webhook.hashlib.sha1)}
+        self.assertEqual(get_client().post(self.url, data=body, headers=headers).status_code, 204)
+
+    def test_rejects_bad_and_missing_signatures(self):
+        bad = webhook.sign('other secret', json.dumps(status_payload()).encode('utf-8'))
+        self.assertEqual(self.send('status', status_payload(), signature=bad), 401)
+        self.assertEqual(self.send('status', status_payload(), signature=None), 401)
+        self.assertFalse(self.receiver.event.is_set())
+        self.assertEqual(self.receiver.drain(), [])
+
+    def test_answers_pings(self):
+        self.assertEqual(self.send('ping', {'zen': 'Keep it logically awesome.'}), 200)
+        self.assertFalse(self.receiver.event.is_set())
+
+    def test_ignores_events_of_other_commits(self):
+        self.assertEqual(self.send('status', status_payload(sha='b' * 40)), 202)
+        self.assertEqual(self.send('push', {'ref': 'refs/heads/master'}), 202)
+        self.assertEqual(self.receiver.drain(), [])
+
+    def test_ignores_check_runs_not_started(self):
+        run = {'id': 1, 'name': 'ci/run', 'head_sha': SHA, 'status': 'queued',
+               'conclusion': None, 'started_at': None, 'completed_at': None}
+        self.assertEqual(self.send('check_run', {'check_run': run}), 202)
+        self.assertEqual(self.receiver.drain(), [])
+
+    def test_rejects_malformed_payloads(self):
+        for payload in (b'{not json', [], {'sha': SHA}, status_payload(at='yesterday')):
+            self.assertEqual(self.send('status', payload), 400)
+        self.assertEqual(self.receiver.drain(), [])
+
+    def test_normalizes_timestamps(self):
+        _, status = webhook.status_from_event(
+            'status', status_payload(at='2019-05-15T15:20:55+02:00'), None)
+        self.assertEqual(status['created_at'], '2019-05-15T13:20:55Z')
+        _, status = webhook.status_from_event('check_run', {'check_run': {
+            'id': 1, 'name': 'ci/run', 'head_sha': SHA, 'status': 'completed',
+            'conclusion': 'success', 'started_at': '2019-05-15T23:50:00-01:30',
+            'completed_at': '2019-05-16T01:20:00.123Z'}}, git_create_pr.check_run_state)
+        self.assertEqual((status['created_at'], status['updated_at'], status['state']),
+                         ('2019-05-16T01:20:00Z', '2019-05-16T01:20:00Z', 'success'))
+
+
+class Pull(object):
+    def __init__(self, url, number, sha):
+        self.number = number
+        self.raw_data = {'statuses_url': '{}/repos/owner/repo/statuses/{}'.format(url, sha)}
+
+
+class WatchPrStatusesTest(unittest.TestCase):
+    """watch_pr_statuses waking up for webhook events between polls."""
+
+    def setUp(self):
+        self.stub = GitHubStub().start()
+        self.receiver = webhook.WebhookReceiver(0, SECRET, SHA, git_create_pr.check_run_state,
+                                                host='127.0.0.1').start()
+        self.load_length = git_create_pr.PR_CONTEXT_LOAD_LENGTH
+        git_create_pr.PR_CONTEXT_LOAD_LENGTH = 0
+        http_cache.configure()
+
+    def tearDown(self):
+        git_create_pr.PR_CONTEXT_LOAD_LENGTH = self.load_length
+        self.receiver.stop()
+        self.stub.stop()
+
+    def test_wakes_up_when_a_status_arrives(self):
+        # The context stays pending as far as polls of the stand-in go
+        self.stub.add_pull(1, SHA, ['ci/test'], finish_after=1000)
+        body = json.dumps(status_payload()).encode('utf-8')
+        sender = threading.Timer(0.5, get_client().post, ['http://127.0.0.1:{}/'.format(
+            self.receiver.port)], {'data': body, 'headers': {
+                'X-GitHub-Event': 'status', 'X-Hub-Signature-256': webhook.sign(SECRET, body)}})
+
+        start = time()
+        sender.start()
+        git_create_pr.watch_pr_statuses(Pull(self.stub.url, 1, SHA), ['ci/test'], 60, 120,
+                                        datetime.utcnow() - timedelta(minutes=1), 'token',
+                                        self.receiver)
+        sender.join()
+        self.assertLess(time() - start, 10)
+        self.assertEqual(self.stub.commits[SHA]['polls'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+
+@contextmanager
+def thread_pool(workers, tasks):
+    """A pool of up to workers threads, no more than the tasks it is given."""
+    pool = ThreadPool(max(1, min(workers, tasks)))
+    try:
+        yield pool
+    finally:
+        pool.close()
+        pool.join()
+
+
+def pool_map(function, items, workers):
+    """Apply function to the items on a thread pool, returns the results in order."""
+    items = list(items)
+    if not items:
+        return []
+    with thread_pool(workers, len(items)) as pool:
+        return pool.map(function, items)
@@ -0,0 +1,134 @@
+#!/usr/bin/python2
+from registry import Registry
+from retag import IMAGES, load_images
+from thread_pool import pool_map
+import re
+import argparse
+import getpass
+import logging as log
+
+WORKERS = 8
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Verify released images from the registry API, '
+                                                 'without pulling them: their labels or '
+                                                 'environment must report the version, and '
+                                                 'optionally another tag must point at the same '
+                                                 'image.')
+
+    parser.add_argument('version', metavar='VERSION', type=str,
+                        help='the tag of the images, which their labels or environment must '
+                             'report (e.g. v0.3.1).')
+
+    parser.add_argument('-s', dest='same_as', type=str, default=None,
+                        help='a tag that must point at the same digest as VERSION (e.g. stable).')
+
+    parser.add_argument('-x', dest='expect', type=str, default=[], nargs='+',
+                        help='KEY=VALUE pairs, the label or environment variable KEY of every '
+                             'image must contain VALUE (e.g. SPARK_VERSION=2.3).')
+
+    parser.add_argument('-i', dest='images', type=str, default=IMAGES,
+                        help='a yaml file with the registry and the list of images to verify '
+                             '(Default {}).'.format(IMAGES))
+
+    parser.add_argument('-u', dest='user', type=str, default=None,
+                        help='a registry user, for private images. Prompts for the password '
+                             'unless [-a] is given.')
+
+    parser.add_argument('-a', dest='token', type=str, default=None,
+                        help='the password or access token of [-u].')
+
+    parser.add_argument('-w', dest='workers', type=int, default=WORKERS,
+                        help='the number of images verified concurrently (Default {}).'
+                        .format(WORKERS))
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+    log.getLogger('requests').setLevel(log.WARNING)
+
+    if args.token and not args.user:
+        parser.error('[-a] requires a user to be specified via [-u].')
+
+    expect = []
+    for pair in args.expect:
+        if '=' not in pair:
+            parser.error('[-x] expects KEY=VALUE pairs, got {}.'.format(pair))
+        expect.append(tuple(pair.split('=', 1)))
+
+    try:
+        registry, images = load_images(args.images)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+
+    auth = None
+    if args.user:
+        auth = (args.user, args.token if args.token else getpass.getpass())
+
+    return args.version, args.same_as, expect, registry, images, auth, args.workers
+
+
+def config_values(config):
+    """Labels and environment variables of an image config, as one dict."""
+    values = dict(var.split('=', 1) for var in config.get('Env') or [] if '=' in var)
+    values.update(config.get('Labels') or {})
+    return values
+
+
+def reports_version(values, version):
+    # v0.3.1 matches 0.3.1 and v0.3.1, but neither 0.3.10 nor 10.3.1
+    number = re.escape(version[1:] if version.startswith('v') else version)
+    pattern = re.compile(r'(?<![\d.])v?{}(?!\.?\d)'.format(number))
+    return any(pattern.search(value) for value in values.values())
+
+
+def verify_image(registry, image, version, same_as=None, expect=()):
+    """Return the problems found with image:version, an empty list if there are none."""
+    problems = []
+    values = config_values(registry.get_image_config(image, version))
+    if not reports_version(values, version):
+        problems.append('no label or environment variable reports version {}'.format(version))
+    for key, value in expect:
+        if key not in values:
+            problems.append('{} is not set'.format(key))
+        elif value not in values[key]:
+            problems.append('{} is {}, expected {}'.format(key, values[key], value))
+
+    if same_as:
+        digest, other = registry.manifest_digest(image, version), \
+            registry.manifest_digest(image, same_as)
+        if digest != other:
+            problems.append('{} points at {}, not {}'.format(same_as, other, digest))
+    return problems
+
+
+def verify_images(registry, images, version, same_as=None, expect=(), workers=WORKERS):
+    """Verify every image concurrently, returns the problems of each image."""
+    def verify(image):
+        try:
+            problems = verify_image(registry, image, version, same_as, expect)
+        except (RuntimeError, IOError, ValueError) as e:
+            problems = [str(e)]
+        for problem in problems:
+            log.error('{}:{}: {}'.format(image, version, problem))
+        if not problems:
+            log.info('{}:{} verified.'.format(image, version))
+        return problems
+
+    return pool_map(verify, images, workers)
+
+
+def main():
+    version, same_as, expect, registry, images, auth, workers = get_opts()
+
+    problems = verify_images(Registry(registry, auth), images, version, same_as, expect, workers)
+    failed = len([p for p in problems if p])
+    if failed:
+        log.error('{} of {} images failed verification.'.format(failed, len(images)))
+        exit(1)
+    log.info('All {} images verified.'.format(len(images)))
+
+
+if __name__ == "__main__":
+    main()
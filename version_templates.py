@@ -0,0 +1,153 @@
+#!/usr/bin/python2
+from http_client import get_client
+from retag import IMAGES, load_images
+from thread_pool import pool_map
+import os
+import re
+import argparse
+import tempfile
+import logging as log
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+RESOURCES_URL = 'https://radanalytics.io/resources.yaml'
+OUTPUT_DIR = 'release_templates'
+FROM_TAG = 'stable'
+WORKERS = 4
+CHUNK_SIZE = 1 << 16
+
+
+def get_opts():
+    parser = argparse.ArgumentParser(description='Write copies of the radanalytics templates '
+                                                 'whose images point at a release tag instead '
+                                                 'of stable.')
+
+    parser.add_argument('version', metavar='VERSION', type=str,
+                        help='the tag the images of the templates should use (e.g. v0.3.1).')
+
+    parser.add_argument('sources', metavar='SOURCE', type=str, nargs='*',
+                        default=[RESOURCES_URL],
+                        help='urls or files of the templates (Default {}).'.format(RESOURCES_URL))
+
+    parser.add_argument('-o', dest='output', type=str, default=OUTPUT_DIR,
+                        help='the directory the templates are written to (Default {}).'
+                        .format(OUTPUT_DIR))
+
+    parser.add_argument('-f', dest='from_tag', type=str, default=FROM_TAG,
+                        help='the tag replaced in the templates (Default {}).'.format(FROM_TAG))
+
+    parser.add_argument('-i', dest='images', type=str, default=IMAGES,
+                        help='a yaml file with the list of images whose tag is replaced '
+                             '(Default {}).'.format(IMAGES))
+
+    args = parser.parse_args()
+
+    log.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s', level=log.INFO)
+    log.getLogger('requests').setLevel(log.WARNING)
+
+    try:
+        _, images = load_images(args.images)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+
+    names = [os.path.basename(urlparse(source).path) for source in args.sources]
+    if len(set(names)) != len(names):
+        parser.error('Every SOURCE must have a different file name.')
+
+    return args.version, args.sources, args.output, args.from_tag, images
+
+
+def compile_pattern(images, from_tag):
+    """One pattern matching a reference to from_tag of any of the images."""
+    names = '|'.join(re.escape(image) for image in sorted(images, key=len, reverse=True))
+    # An optional registry host, e.g. docker.io/ or localhost:5000/, may precede the image
+    registry = r'(?:(?:[\w-]+(?:\.[\w-]+)+|localhost)(?::\d+)?/)?'
+    return re.compile(r'(?<![\w./-])({}(?:{})):{}(?![\w.-])'
+                      .format(registry, names, re.escape(from_tag)))
+
+
+def read_lines(source):
+    """Yield the lines of a url or file as they arrive, without reading it whole."""
+    if not re.match(r'^https?://', source):
+        with open(source, 'rb') as f:
+            for line in f:
+                yield line
+        return
+
+    r = get_client().get(source, stream=True)
+    if r.status_code != 200:
+        raise IOError('Unable to download {}, status code {}.'.format(source, r.status_code))
+    pending = b''
+    for chunk in r.iter_content(CHUNK_SIZE):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+
+def version_template(source, dest, version, pattern):
+    """Stream source to dest, pointing the images matched by pattern at version.
+
+    dest is only replaced once the whole template was written. Returns the
+    substitutions made, as (line number, old reference, new reference).
+    """
+    substitutions = []
+
+    def substitute(match, number):
+        new = '{}:{}'.format(match.group(1), version)
+        substitutions.append((number, match.group(0), new))
+        return new
+
+    directory = os.path.dirname(os.path.abspath(dest))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(dest)))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for number, line in enumerate(read_lines(source), 1):
+                text = line.decode('utf-8')
+                out.write(pattern.sub(lambda m: substitute(m, number), text).encode('utf-8'))
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, dest)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return substitutions
+
+
+def version_templates(sources, output, version, images, from_tag=FROM_TAG, workers=WORKERS):
+    """Version every source into output concurrently, returns the substitutions of each."""
+    pattern = compile_pattern(images, from_tag)
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    def version_source(source):
+        dest = os.path.join(output, os.path.basename(urlparse(source).path))
+        substitutions = version_template(source, dest, version, pattern)
+        for number, old, new in substitutions:
+            log.info('{}:{}: {} -> {}'.format(dest, number, old, new))
+        if not substitutions:
+            log.warn('No image of {} uses the {} tag.'.format(source, from_tag))
+        return substitutions
+
+    return pool_map(version_source, sources, workers)
+
+
+def main():
+    version, sources, output, from_tag, images = get_opts()
+
+    try:
+        substitutions = version_templates(sources, output, version, images, from_tag)
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        log.error(e)
+        exit(1)
+    log.info('Successfully wrote {} templates to {} with version tag {}, {} images replaced.'
+             .format(len(sources), output, version, sum(len(s) for s in substitutions)))
+
+
+if __name__ == "__main__":
+    main()
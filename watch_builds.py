@@ -1,14 +1,21 @@
 #!/usr/bin/python2
 import argparse
 import re
-import requests
-from time import sleep
+import http_cache
+from http_client import get_client
+from metrics import get_metrics
+from time import time
 import logging as log
 import json
+from poll_scheduler import PollScheduler, MIN_INTERVAL
+from build_tracker import BuildTracker
+from thread_pool import pool_map, thread_pool
 
 # Docker api v2 build status codes:
 SUCCESS, QUEUED, CANCELLED = 10, 0, -4
 
+BUILDING_CODES = (2, 3)
+
 STATUS_CODES = {
     10: 'SUCCESS',
     3: 'BUILDING', 2: 'BUILDING',
@@ -23,6 +30,15 @@ REGISTRY_ENDPOINT = 'https://registry.hub.docker.com'
 # Defaults
 INTERVAL = 120
 RETRIES = 30
+WORKERS = 8
+
+# Builds read by the first history fetch, and per page by later ones
+HISTORY_PAGE_SIZE = 200
+INCREMENTAL_PAGE_SIZE = 10
+
+# Seconds to wait for the build of a trigger to show up, and between the checks
+CONFIRM_TIMEOUT = 300
+CONFIRM_INTERVAL = 2
 
 WITH_VERBOSITY = log.DEBUG
 WITHOUT_VERBOSITY = log.INFO
@@ -31,10 +47,24 @@ WITHOUT_VERBOSITY = log.INFO
 def get_opts():
     parser = argparse.ArgumentParser(description='Watch a dockerhub repo autobuild.')
 
-    parser.add_argument('repo', metavar='R', type=str, nargs=1,
+    parser.add_argument('repo', metavar='R', type=str, nargs='?', default=None,
                         help='a dockerhub repo in the format user/repo')
 
-    parser.add_argument('token', metavar='T', type=str, nargs=1, help='A dockerhub trigger token')
+    parser.add_argument('token', metavar='T', type=str, nargs='?', default=None,
+                        help='A dockerhub trigger token')
+
+    parser.add_argument('-m', dest='manifest', type=str, default=None,
+                        help='a json file listing several repos to watch at once, in the format '
+                             '[{"repo": "user/repo", "token": "T", "tags": [], "branches": []}]. '
+                             'Replaces the R and T arguments.')
+
+    parser.add_argument('-w', dest='workers', default=WORKERS, type=int,
+                        help='the maximum number of repos polled concurrently'
+                             ' (Default {}).'.format(WORKERS))
+
+    parser.add_argument('-c', dest='cache_dir', default=None, type=str,
+                        help='a directory in which to keep polled responses so unchanged ones are '
+                             'revalidated instead of re-downloaded, in memory only by default.')
 
     parser.add_argument('-f', '--force', dest='force', action='store_true',
                         help='force trigger a build even if the last build is in a '
@@ -43,12 +73,17 @@ def get_opts():
     parser.add_argument('-v', '--verbose', help='increase output verbosity', action='store_true')
 
     parser.add_argument('-i', dest='interval', default=[INTERVAL], type=int, nargs=1,
-                        help='the length of the interval between each poll in seconds'
+                        help='the maximum length of the interval between each poll in seconds,'
+                             ' polls start shorter and back off while nothing changes'
                              ' (Default {}).'.format(INTERVAL))
 
     parser.add_argument('-r', dest='retries', default=[RETRIES], type=int, nargs=1,
-                        help='the maximum number of times dockerhub is '
-                             'polled for build status updates (Default {}).'.format(RETRIES))
+                        help='used with [-i] to derive the deadline when [-d] is not given'
+                             ' (Default {}).'.format(RETRIES))
+
+    parser.add_argument('-d', dest='deadline', default=None, type=int,
+                        help='the total number of seconds to watch the builds for'
+                             ' (Default interval * retries).')
 
     parser.add_argument('-t', metavar='Tag', dest='tags', default=[], type=str, nargs="+",
                         help='supply the tag source from which the build was created, to watch.')
@@ -56,10 +91,56 @@ def get_opts():
     parser.add_argument('-b', metavar='Branch', dest='branches', default=[], type=str, nargs="+",
                         help='supply the branch source from which the build was created, to watch.')
 
+    parser.add_argument('-H', dest='history', type=str, default=None,
+                        help='a file the queue wait and duration of finished builds are appended '
+                             'to, and which past durations are read from to poll around the '
+                             'time running builds should finish.')
+
+    parser.add_argument('--metrics', dest='metrics', type=str, default=None,
+                        help='write the time each build spent in each state to this file on exit, '
+                             'as json lines if it ends in .json or .jsonl, as a Prometheus '
+                             'textfile otherwise.')
+
     args = parser.parse_args()
 
-    tags = args.tags
-    branches = args.branches
+    interval, force, verbose, workers = \
+        args.interval[0], args.force, args.verbose, args.workers
+    deadline = args.deadline if args.deadline is not None else interval * args.retries[0]
+
+    loglevel = WITH_VERBOSITY if verbose else WITHOUT_VERBOSITY
+    log.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=loglevel)
+    log.getLogger('requests').setLevel(log.WARNING)
+
+    if args.cache_dir:
+        http_cache.configure(path=args.cache_dir)
+
+    if args.metrics:
+        get_metrics().export_at_exit(args.metrics)
+
+    if args.manifest:
+        if args.repo or args.token:
+            parser.error('R and T can not be combined with [-m].')
+        with open(args.manifest, 'r') as manifest:
+            entries = json.load(manifest)
+    elif args.repo and args.token:
+        entries = [{'repo': args.repo, 'token': args.token,
+                    'tags': args.tags, 'branches': args.branches}]
+    else:
+        parser.error('Either R and T or [-m] must be provided.')
+
+    watches = []
+    for entry in entries:
+        if 'repo' not in entry or 'token' not in entry:
+            parser.error('Every manifest entry requires a repo and a token.')
+        repo, token = entry['repo'], entry['token']
+        validate(parser, repo, token)
+        docker_tags = get_docker_tags(entry.get('tags', []), entry.get('branches', []))
+        watches.append(RepoWatch(repo, token, force, docker_tags))
+
+    return interval, deadline, workers, watches, args.history
+
+
+def get_docker_tags(tags, branches):
     docker_tags = []
     for tag in tags:
         meta_info = {
@@ -76,18 +157,7 @@ def get_opts():
             "docker_tag": "{}-latest".format(branch)
         }
         docker_tags.append(meta_info)
-
-    repo, token, interval, retries, force, verbose = \
-        args.repo[0], args.token[0], args.interval[0], args.retries[0], \
-        args.force, args.verbose
-
-    loglevel = WITH_VERBOSITY if verbose else WITHOUT_VERBOSITY
-    log.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=loglevel)
-    log.getLogger('requests').setLevel(log.WARNING)
-
-    validate(parser, repo, token)
-
-    return repo, token, interval, retries, force, docker_tags
+    return docker_tags
 
 
 def validate(parser, repo, token):
@@ -96,18 +166,6 @@ def validate(parser, repo, token):
     if not re.match(pattern, repo):
         parser.error('A malformed repo was provided. Use -h for detailed usage instructions.')
 
-    user, repo = repo.split('/')
-
-    # Check if repo exist
-    r = requests.get('{}/repositories/{}/{}'.format(V2_ENDPOINT, user, repo))
-    if r.status_code >= 400:
-        parser.error('Repo not found, ensure the repo supplied is wellformed and exists: '
-                     '<user>/<repo>')
-
-    data = r.json()
-    log.info('Found repo: {}/{}, Description: {}'.format(data['user'], data['name'],
-                                                         data['description']))
-
     # Check token syntax
     if re.search(r'[^A-z0-9-]', token):
         parser.error('Token is malformed, please provide a proper token.')
@@ -119,10 +177,18 @@ def status_lookup(code):
     return STATUS_CODES[code]
 
 
+# The repo's existence is checked by its first build history request
+def get_history(url, user, repo):
+    r = http_cache.conditional_get(url)
+    if r.status_code >= 400:
+        raise RuntimeError('Repo {}/{} not found, ensure the repo supplied is wellformed and '
+                           'exists: <user>/<repo>'.format(user, repo))
+    return r.json()
+
+
 def fetch_build_latest(user, repo):
-    r = requests.get('{}/repositories/{}/{}/buildhistory/?page_size=1'
-                     .format(V2_ENDPOINT, user, repo))
-    data = r.json()
+    data = get_history('{}/repositories/{}/{}/buildhistory/?page_size=1'
+                       .format(V2_ENDPOINT, user, repo), user, repo)
     if not data['results']:
         log.error('This repo does not have any builds in its history to watch')
         raise RuntimeError('Repo {} does not have any builds in its history to watch'.format(repo))
@@ -130,27 +196,72 @@ def fetch_build_latest(user, repo):
     return build
 
 
+class BuildHistory(object):
+    """Cursor over a repo's build history that matches builds to the watched tags.
+
+    Tags are indexed by docker tag so each build is matched in O(1). History
+    is newest first, so the first build seen for a tag is its most recent.
+    The first fetch reads up to page_size builds. Later fetches stop as soon
+    as every tag is matched, or once they reach builds older than the oldest
+    match of the previous fetch, since nothing older can become the most
+    recent build of a tag. Their pages reach that oldest match plus
+    INCREMENTAL_PAGE_SIZE new builds, so a poll is a single request unless
+    more builds than that were added since the last one.
+    """
+
+    def __init__(self, user, repo, tags, page_size=HISTORY_PAGE_SIZE):
+        self.user = user
+        self.repo = repo
+        self.index = dict((tag['docker_tag'], tag) for tag in tags)
+        self.page_size = page_size
+        self.floor_id = None
+        self.floor_depth = 0
+
+    def fetch(self):
+        first = self.floor_id is None
+        page_size = self.page_size if first else \
+            min(self.page_size, self.floor_depth + INCREMENTAL_PAGE_SIZE)
+        endpoint = '{}/repositories/{}/{}/buildhistory/?page_size={}' \
+            .format(V2_ENDPOINT, self.user, self.repo, page_size)
+
+        builds_matched = {}
+        depths = {}
+        depth = 0
+        while endpoint:
+            data = get_history(endpoint, self.user, self.repo)
+            for build in data['results']:
+                if not first and build.get('id', self.floor_id) < self.floor_id:
+                    return self._matched(builds_matched, depths)
+
+                docker_tag = build['dockertag_name']
+                if docker_tag in self.index and docker_tag not in builds_matched:
+                    build['source_info'] = self.index[docker_tag]
+                    builds_matched[docker_tag] = build
+                    depths[docker_tag] = depth
+                    if len(builds_matched) == len(self.index):
+                        return self._matched(builds_matched, depths)
+                depth += 1
+
+            # The first fetch is bounded to a single page of page_size builds
+            endpoint = None if first else data.get('next')
+        return self._matched(builds_matched, depths)
+
+    def _matched(self, builds_matched, depths):
+        # The oldest of the current matches only moves up as tags are rebuilt
+        builds = list(builds_matched.values())
+        ids = [build['id'] for build in builds if 'id' in build]
+        if ids and len(ids) == len(builds):
+            self.floor_id = min(ids)
+            self.floor_depth = max(depths.values())
+        else:
+            self.floor_id = None
+        return builds
+
+
 # Finds builds that match the provided tags
 # Only the most recent matches are returned if more than one are found.
 def fetch_builds(tags_original, user, repo, page_size):
-    endpoint = '{}/repositories/{}/{}/buildhistory/?page_size={}' \
-        .format(V2_ENDPOINT, user, repo, page_size)
-
-    r = requests.get(endpoint)
-    data = r.json()
-
-    builds_retrieved = data['results']
-    builds_matched = []
-    tags = tags_original[:]
-    for i, build in enumerate(builds_retrieved):
-        i = 0
-        while i < len(tags) and tags:
-            if build['dockertag_name'] == tags[i]['docker_tag']:
-                build['source_info'] = tags[i]
-                builds_matched.append(build)
-                del tags[i]
-            i += 1
-    return builds_matched
+    return BuildHistory(user, repo, tags_original, page_size).fetch()
 
 
 def trigger_build(user, repo, build, token, force=False):
@@ -171,66 +282,144 @@ def trigger_build(user, repo, build, token, force=False):
         data = {"source_type": source_info['source_type'], "source_name": source_info['sourceref']}
         endpoint = '{}/u/{}/{}/trigger/{}/'.format(REGISTRY_ENDPOINT, user, repo, token)
         headers = {'Content-type': 'application/json'}
-        r = requests.post(endpoint, headers=headers, data=json.dumps(data))
+        r = get_client().post(endpoint, headers=headers, data=json.dumps(data))
     else:
         endpoint = '{}/u/{}/{}/trigger/{}/'.format(REGISTRY_ENDPOINT, user, repo, token)
-        r = requests.post(endpoint)
+        r = get_client().post(endpoint)
 
     if r.status_code != 200:
         raise RuntimeError('Trigger request failed. Received status code:{}. '
                            'Ensure the token is correct.'.format(r.status_code))
-
-    # Allot time for request to go through
-    sleep(5)
+    get_metrics().inc('build_triggers_total', repo='{}/{}'.format(user, repo))
     return r.status_code == 200
 
 
-def watch_build(repo, token, interval, retries, force, tags):
-    user, repo = repo.split('/')
-
-    builds_to_watch = fetch_builds(tags, user, repo, 200) \
-        if len(tags) > 0 else [fetch_build_latest(user, repo)]
-
-    if not builds_to_watch:
-        log.error('Could not find any builds.')
-        raise RuntimeError('Repo {} does not have any builds in its history to watch'.format(repo))
-
-    # Check if the builds_to_watch are all in a non-success state
-    # If they are not in a BUILDING or QUEUED state we only proceed if [-f] is supplied
-    initial_builds_to_trigger = []
-    for build in builds_to_watch:
-        status, build_code = build['status'], build['build_code']
-        if status == SUCCESS or status < QUEUED:
-            if not force:
+def build_source(build):
+    """The source a trigger of the build rebuilds, None for the latest build of the repo."""
+    if 'source_info' not in build:
+        return None
+    return build['source_info']['source_type'], build['source_info']['sourceref']
+
+
+class BuildTriggers(object):
+    """Triggers sent for the builds of a repo, one per source, until confirmed.
+
+    A trigger is in flight from when it is sent until a build of its source
+    that was not in the history at the time shows up, so it is never sent
+    twice for the same source. Triggers not confirmed after timeout seconds
+    are dropped, letting the source be triggered again.
+    """
+
+    def __init__(self, repo, timeout=CONFIRM_TIMEOUT, clock=time):
+        self.repo = repo
+        self.timeout = timeout
+        self.clock = clock
+        self.in_flight = {}
+
+    def needed(self, builds, force=False):
+        """One build per source to trigger: failed ones, or any with force.
+
+        Sources with a build queued or running, or a trigger in flight, are
+        skipped as they will be rebuilt anyway.
+        """
+        busy = set(build_source(b) for b in builds if b['status'] >= QUEUED and
+                   b['status'] != SUCCESS)
+        wanted = {}
+        for build in builds:
+            source = build_source(build)
+            if (force or build['status'] < QUEUED) and source not in busy and \
+                    source not in self.in_flight:
+                wanted.setdefault(source, build)
+        return list(wanted.values())
+
+    def sent(self, build, builds):
+        source = build_source(build)
+        codes = set(b['build_code'] for b in builds if build_source(b) == source)
+        self.in_flight[source] = (codes, self.clock())
+
+    def update(self, builds):
+        """Confirm the triggers with a new build in builds, drop the timed out ones."""
+        for source, (codes, sent) in list(self.in_flight.items()):
+            new = [b for b in builds if build_source(b) == source and b['build_code'] not in codes]
+            elapsed = self.clock() - sent
+            if new:
+                log.info('{}: trigger confirmed by build {} after {:.0f} seconds.'
+                         .format(self.repo, new[0]['build_code'], elapsed))
+                get_metrics().observe('build_trigger_confirm_seconds', elapsed, repo=self.repo)
+                del self.in_flight[source]
+            elif elapsed > self.timeout:
+                log.warn('{}: no build showed up {} seconds after triggering {}, it will be '
+                         'triggered again.'.format(self.repo, self.timeout, source or 'it'))
+                del self.in_flight[source]
+
+
+class RepoWatch(object):
+    """Watch state for the autobuilds of a single dockerhub repo."""
+
+    def __init__(self, repo, token, force, tags):
+        self.repo = repo
+        self.user, self.name = repo.split('/')
+        self.token = token
+        self.force = force
+        self.tags = tags
+        self.history = BuildHistory(self.user, self.name, tags) if tags else None
+        self.triggers = BuildTriggers(repo)
+        self.to_trigger = []
+        self.builds = []
+        self.succeeded = False
+        self.done = False
+        self.error = None
+
+    def fetch(self):
+        self.builds = self.history.fetch() \
+            if self.history else [fetch_build_latest(self.user, self.name)]
+        self.triggers.update(self.builds)
+        for build in self.builds:
+            get_metrics().state('watch_build_state_seconds_total', status_lookup(build['status']),
+                                repo=self.repo, build=build['build_code'])
+        return self.builds
+
+    def start(self):
+        builds_to_watch = self.fetch()
+
+        if not builds_to_watch:
+            log.error('Could not find any builds.')
+            raise RuntimeError('Repo {} does not have any builds in its history to watch'
+                               .format(self.name))
+
+        # Check if the builds_to_watch are all in a non-success state
+        # If they are not in a BUILDING or QUEUED state we only proceed if [-f] is supplied
+        for build in builds_to_watch:
+            status, build_code = build['status'], build['build_code']
+            if (status == SUCCESS or status < QUEUED) and not self.force:
                 state = 'success' if status == SUCCESS else 'stalled'
                 error_msg = 'The build [{}] is in a {} state. Nothing to watch. Use -f to ' \
                             'force a trigger. Exiting.'.format(build_code, state)
                 log.error(error_msg)
                 raise RuntimeError(error_msg)
 
-            else:
-                initial_builds_to_trigger.append(build)
-
-    for build in initial_builds_to_trigger:
-        trigger_build(user, repo, build, token, force=force)
-
-    # If builds were triggered, update build information
-    if initial_builds_to_trigger:
-        builds_to_watch = fetch_builds(tags, user, repo, 200) \
-            if len(tags) > 0 else [fetch_build_latest(user, repo)]
-
-    log.info('Polling dockerhub every {} seconds for a maximum of {} polls...'
-             .format(interval, retries))
-
-    for build in builds_to_watch:
-        status, build_code = build['status'], build['build_code']
-        log.debug('Watching build: {}, status: {}'.format(build_code, status_lookup(status)))
+        # Successful builds are only rebuilt on the first poll, with [-f]
+        self.to_trigger = [b for b in self.triggers.needed(builds_to_watch, force=self.force)
+                           if b['status'] == SUCCESS or b['status'] < QUEUED]
 
-    all_builds_succeeded = False
-    while not all_builds_succeeded and retries > 0:
+        for build in builds_to_watch:
+            status, build_code = build['status'], build['build_code']
+            log.debug('{}: watching build: {}, status: {}'
+                      .format(self.repo, build_code, status_lookup(status)))
+
+    def confirm(self, deadline):
+        """Wait up to deadline seconds for the builds of the triggers sent to show up."""
+        schedule = PollScheduler(min(self.triggers.timeout, deadline), max_interval=MIN_INTERVAL,
+                                 min_interval=CONFIRM_INTERVAL)
+        while self.triggers.in_flight and not schedule.expired():
+            schedule.observe(None, busy=True)
+            schedule.wait()
+            self.fetch()
+
+    def check(self):
         # If one of the builds is successful, remove from watch list
         new_builds_to_watch, builds_to_trigger, builds_in_process = [], [], []
-        for build in builds_to_watch:
+        for build in self.builds:
             status = build['status']
             if status != SUCCESS:
                 new_builds_to_watch.append(build)
@@ -239,44 +428,146 @@ def watch_build(repo, token, interval, retries, force, tags):
                 else:
                     builds_in_process.append(build)
 
-        builds_to_watch = new_builds_to_watch
+        self.builds = new_builds_to_watch
 
-        # There is no point in triggering a new build if one is already queued/building
-        if not builds_in_process and builds_to_trigger:
-            trigger_build(user, repo, builds_to_trigger[0], token, force=True)
+        # Every failed source is triggered at once, unless it is already being rebuilt
+        self.to_trigger = self.triggers.needed(self.builds)
 
-        # TODO: Set log level check conditions, ignore loops if not debug
         for b in builds_to_trigger:
-            log.debug("Builds to trigger: {}, code: {}".format(b['status'], b['build_code']))
+            log.debug("{}: builds to trigger: {}, code: {}"
+                      .format(self.repo, b['status'], b['build_code']))
 
         for b in builds_in_process:
-            log.debug("Builds in process: {}, code: {}".format(b['status'], b['build_code']))
+            log.debug("{}: builds in process: {}, code: {}"
+                      .format(self.repo, b['status'], b['build_code']))
 
-        for b in builds_to_watch:
-            log.debug("Builds to watch: {}, code: {}".format(b['status'], b['build_code']))
+        for b in self.builds:
+            log.debug("{}: builds to watch: {}, code: {}"
+                      .format(self.repo, b['status'], b['build_code']))
 
         # If no builds to watch we're done
-        if builds_to_watch:
-            sleep(interval)
-            builds_to_watch = fetch_builds(tags, user, repo, 200) \
-                if len(tags) > 0 else [fetch_build_latest(user, repo)]
-        else:
-            all_builds_succeeded = True
+        if not self.builds:
+            log.info('{}: all builds successfully completed.'.format(self.repo))
+            self.succeeded = True
+            self.done = True
+
+
+def _run_step(args):
+    # Pool workers record failures on the watch rather than aborting the other repos
+    watch, step, step_args = args[0], args[1], args[2:]
+    try:
+        getattr(watch, step)(*step_args)
+    except Exception as e:
+        log.error('{}: {}'.format(watch.repo, e))
+        watch.error = str(e)
+        watch.done = True
+    return watch
+
+
+def _send_trigger(args):
+    watch, build = args
+    try:
+        trigger_build(watch.user, watch.name, build, watch.token, force=True)
+        watch.triggers.sent(build, watch.builds)
+    except Exception as e:
+        log.error('{}: {}'.format(watch.repo, e))
+        watch.error = str(e)
+        watch.done = True
+    return watch
+
+
+def send_triggers(watches, workers=WORKERS):
+    """Send the triggers the watches need concurrently, returns the watches that sent one."""
+    triggers = [(w, build) for w in watches if not w.done for build in w.to_trigger]
+    for w in watches:
+        w.to_trigger = []
+    pool_map(_send_trigger, triggers, workers)
+    return [w for w in set(t[0] for t in triggers) if not w.done]
+
+
+def track(tracker, watches):
+    for w in watches:
+        if w.error:
+            continue
+        for build in w.builds:
+            tracker.observe(w.repo, build.get('dockertag_name'), build['build_code'],
+                            status_lookup(build['status']))
+
+
+def watch_builds(watches, interval, deadline, workers=WORKERS, tracker=None):
+    """Watch the autobuilds of several repos on a single, shared poll schedule.
+
+    Each poll fetches every repo still being watched concurrently on a thread
+    pool, sends the triggers of every failed build concurrently, then waits
+    once for the interval chosen by the PollScheduler, which is told
+    when the running builds should finish if the BuildTracker knows their
+    typical durations. Returns a dict of repo -> True if all of its builds
+    succeeded.
+    """
+    tracker = tracker or BuildTracker()
+    schedule = PollScheduler(deadline, max_interval=interval)
+    with thread_pool(workers, len(watches)) as pool:
+        pool.map(_run_step, [(w, 'start') for w in watches])
+        # Builds triggered up front may have succeeded before, so they are only watched once
+        # their new builds show up
+        pool.map(_run_step, [(w, 'confirm', schedule.remaining())
+                             for w in send_triggers(watches, workers)])
+        track(tracker, watches)
+
+        log.info('Polling dockerhub at most every {} seconds for up to {} seconds...'
+                 .format(interval, deadline))
+
+        active = [w for w in watches if not w.done]
+        while active and not schedule.expired():
+            pool.map(_run_step, [(w, 'check') for w in active])
+            send_triggers(active, workers)
+            active = [w for w in active if not w.done]
+            if active:
+                builds = [b for w in active for b in w.builds]
+                # Triggered builds are polled for as closely as running ones
+                busy = any(b['status'] in BUILDING_CODES for b in builds) or \
+                    any(w.triggers.in_flight for w in active)
+                schedule.observe(sorted((b['build_code'], b['status']) for b in builds),
+                                 busy=busy,
+                                 due=tracker.next_due([b['build_code'] for b in builds]))
+                schedule.wait()
+                pool.map(_run_step, [(w, 'fetch') for w in active])
+                track(tracker, active)
+                active = [w for w in active if not w.done]
+
+    for line in tracker.summary():
+        log.info(line)
+
+    results = {}
+    for w in watches:
+        results[w.repo] = w.succeeded
+        if not w.succeeded:
+            log.warn('{}: all builds were not successfully completed{}.'
+                     .format(w.repo, ' ({})'.format(w.error) if w.error else ''))
+    return results
+
+
+def watch_build(repo, token, interval=INTERVAL, deadline=None, force=False, tags=None,
+                branches=None):
+    """Watch the builds of the tags and branches of a repo, as the command line does."""
+    deadline = deadline if deadline is not None else interval * RETRIES
+    watch = RepoWatch(repo, token, force, get_docker_tags(tags or [], branches or []))
+    watch_builds([watch], interval, deadline)
+
+    if not watch.succeeded:
+        raise RuntimeError(watch.error or 'All builds were not successfully completed.')
 
-        retries -= 1
 
-    if not all_builds_succeeded:
-        error_msg = 'All builds were not successfully completed.'
-        log.warn(error_msg)
-        RuntimeError(error_msg)
-    else:
-        log.info('All builds successfully completed.')
+def main():
+    interval, deadline, workers, watches, history = get_opts()
+    results = watch_builds(watches, interval, deadline, workers, BuildTracker(history))
 
+    for repo in sorted(results):
+        log.info('{}: {}'.format(repo, 'SUCCESS' if results[repo] else 'FAILED'))
 
-def main():
-    repo, token, interval, retries, force, tags = get_opts()
-    watch_build(repo, token, interval, retries, force, tags)
+    if not all(results.values()):
+        exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
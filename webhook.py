@@ -0,0 +1,152 @@
+import re
+import hmac
+import json
+import hashlib
+import threading
+import logging as log
+from datetime import datetime, timedelta
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+# Events describing the state of a commit's contexts
+STATUS_EVENT, CHECK_RUN_EVENT, PING_EVENT = 'status', 'check_run', 'ping'
+
+# Timestamps of the statuses api, in UTC, which get_status compares as strings
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+TIMESTAMP = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?'
+                       r'(Z|(?P<sign>[+-])(?P<hours>\d\d):?(?P<minutes>\d\d))$')
+
+
+def sign(secret, body, digest=hashlib.sha256):
+    """Signature github sends for a payload, e.g. in X-Hub-Signature-256."""
+    name = 'sha256' if digest is hashlib.sha256 else 'sha1'
+    return '{}={}'.format(name, hmac.new(secret.encode('utf-8'), body, digest).hexdigest())
+
+
+def verify(secret, body, headers):
+    if headers.get('X-Hub-Signature-256'):
+        expected, received = sign(secret, body), headers.get('X-Hub-Signature-256')
+    elif headers.get('X-Hub-Signature'):
+        expected, received = sign(secret, body, hashlib.sha1), headers.get('X-Hub-Signature')
+    else:
+        return False
+    return hmac.compare_digest(expected.encode('utf-8'), received.encode('utf-8'))
+
+
+def utc_timestamp(timestamp):
+    """Convert an ISO 8601 timestamp, e.g. 2019-05-15T15:20:55+02:00, to DATE_FORMAT."""
+    match = TIMESTAMP.match(timestamp)
+    if not match:
+        raise ValueError('Unrecognized timestamp {}.'.format(timestamp))
+    moment = datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S')
+    if match.group('sign'):
+        offset = timedelta(hours=int(match.group('hours')), minutes=int(match.group('minutes')))
+        moment = moment - offset if match.group('sign') == '+' else moment + offset
+    return moment.strftime(DATE_FORMAT)
+
+
+def status_from_event(event, payload, check_run_state):
+    """Convert a status or check_run payload into the status format of get_status.
+
+    Status payloads carry timestamps with an offset, e.g. +00:00, rather
+    than the Z of the api, so they are converted before being compared. The
+    status of a check run that has not started yet is None, as get_status
+    skips those.
+    """
+    if event == STATUS_EVENT:
+        return payload['sha'], {
+            'id': payload['id'],
+            'context': payload['context'],
+            'state': payload['state'],
+            'created_at': utc_timestamp(payload['created_at']),
+            'updated_at': utc_timestamp(payload['updated_at'])
+        }
+    run = payload['check_run']
+    if not run['started_at']:
+        return run['head_sha'], None
+    return run['head_sha'], {
+        'id': run['id'],
+        'context': run['name'],
+        'state': check_run_state(run),
+        'created_at': utc_timestamp(run['started_at']),
+        'updated_at': utc_timestamp(run['completed_at'] or run['started_at'])
+    }
+
+
+class WebhookReceiver(object):
+    """Local listener for github status and check_run webhooks of one commit.
+
+    Payloads are verified against the webhook secret, converted with
+    status_from_event and queued. The event is set whenever a status
+    arrives, so a PollScheduler waiting on it wakes up immediately.
+    """
+
+    def __init__(self, port, secret, sha, check_run_state, host=''):
+        self.secret = secret
+        self.sha = sha
+        self.check_run_state = check_run_state
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.statuses = []
+        self.server = HTTPServer((host, port), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                log.debug('Webhook: ' + fmt % args)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not verify(receiver.secret, body, self.headers):
+                    log.warn('Rejected a webhook payload with a missing or bad signature.')
+                    self.send_response(401)
+                else:
+                    self.send_response(receiver.receive(self.headers.get('X-GitHub-Event'), body))
+                self.end_headers()
+
+        return Handler
+
+    def receive(self, event, body):
+        """Queue a verified payload, returns the http status to answer with."""
+        if event == PING_EVENT:
+            return 200
+        if event not in (STATUS_EVENT, CHECK_RUN_EVENT):
+            return 202
+        try:
+            sha, status = status_from_event(event, json.loads(body.decode('utf-8')),
+                                            self.check_run_state)
+        except (ValueError, KeyError, TypeError):
+            return 400
+        if sha != self.sha or status is None:
+            return 202
+
+        log.info('Webhook: context {} is {}.'.format(status['context'], status['state']))
+        with self.lock:
+            self.statuses.append(status)
+        self.event.set()
+        return 204
+
+    def drain(self):
+        with self.lock:
+            statuses, self.statuses = self.statuses, []
+        return statuses
+
+    def start(self):
+        log.info('Listening for github webhooks on port {}.'.format(self.port))
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()